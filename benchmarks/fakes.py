@@ -0,0 +1,140 @@
+"""
+Scripted stand-ins for the network: an LLM provider that always plans the same way
+and a search backend with canned results. Both sleep for a configurable time, so the
+benchmark measures our own pipeline (agent loop, tools, parsing, exports) plus a
+predictable, repeatable amount of "network" time.
+"""
+import re
+import json
+import time
+import hashlib
+from src.llm_services.base_service import BaseLLMService
+from src.llm_services.agent_loop import ChatTurn, ToolCall
+from src.tools.search_backend import SearchBackend
+from src.tools.tools_list import get_tool_lists
+from src.tools.prompt import get_skeleton_system_prompt, get_day_system_prompt
+
+# Gazetteer attractions (data/gazetteer.tsv), so geocode_place and the coordinate fix-up really run
+ATTRACTIONS = ["大阪城", "道頓堀", "心齋橋", "日本環球影城", "黑門市場", "通天閣", "新世界",
+               "梅田藍天大廈", "海遊館", "四天王寺", "阿倍野HARUKAS", "難波八阪神社", "住吉大社"]
+PAID_ATTRACTIONS = ["日本環球影城", "海遊館", "梅田藍天大廈"]
+ATTRACTIONS_PER_DAY = 3
+
+_DAY_LINE = re.compile(r"第 (\d+) 天")
+_DAYS_LINE = re.compile(r"剛好有 (\d+) 天")
+
+
+def _estimate_tokens(messages: list) -> int:
+    return sum(len(str(m.get("content") or "")) for m in messages) // 4
+
+
+class CannedSearchBackend(SearchBackend):
+    """
+    Deterministic search results (a few per query) after `latency` seconds
+    """
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+
+    def text(self, query, region="wt-wt", max_results=5):
+        time.sleep(self.latency)
+        digest = hashlib.sha256(query.encode("utf-8")).hexdigest()[:8]
+        return [
+            {
+                "title": f"{query} 推薦 #{i + 1}",
+                "href": f"https://example.com/{digest}/{i + 1}",
+                "body": f"{query} 的心得分享，費用約 TWD {1000 * (i + 1):,}，交通方便，建議停留半天。",
+            }
+            for i in range(max_results)
+        ]
+
+    def images(self, query, max_results=1):
+        time.sleep(self.latency)
+        return [{"image": f"https://example.com/img/{i}.jpg"} for i in range(max_results)]
+
+
+class ScriptedLLMService(BaseLLMService):
+    """
+    Plans like a well-behaved model:
+    round 1 calls the research tools (internet, flights, tickets, one geocode per attraction),
+    round 2 answers with the trip JSON. Day requests of the fan-out answer directly.
+    :param round_latency: seconds per chat round (time to first token)
+    :param seconds_per_day: extra output time per planned day (long answers are slower)
+    """
+
+    def __init__(self, round_latency: float = 0.3, seconds_per_day: float = 0.05,
+                 destination: str = "大阪", origin: str = "台北"):
+        self.model = "scripted"
+        self.tools = get_tool_lists()
+        self.round_latency = round_latency
+        self.seconds_per_day = seconds_per_day
+        self.destination = destination
+        self.origin = origin
+
+    @staticmethod
+    def _attractions(day: int) -> list:
+        start = (day - 1) * ATTRACTIONS_PER_DAY
+        # Every other attraction without coordinates, like real model output
+        return [
+            {
+                "name": ATTRACTIONS[(start + i) % len(ATTRACTIONS)],
+                "time": f"{10 + 3 * i}:00",
+                "description": f"第 {day} 天的第 {i + 1} 個行程，" + "沿途散步、品嚐在地小吃並拍照留念。" * 4,
+                "latitude": None if i % 2 else 34.6873,
+                "longitude": None if i % 2 else 135.5262,
+            }
+            for i in range(ATTRACTIONS_PER_DAY)
+        ]
+
+    def _research_calls(self, days: int) -> list:
+        calls = [
+            ("search_internet", {"query": f"{self.destination} 熱門景點"}),
+            ("search_flight_average_cost", {"origin": self.origin, "destination": self.destination}),
+            ("search_flights", {"origin": self.origin, "destination": self.destination, "departure_date": "2025-01-01"}),
+            ("search_activity_tickets_batch", {"keywords": PAID_ATTRACTIONS}),
+        ]
+        names = {a["name"] for day in range(1, days + 1) for a in self._attractions(day)}
+        calls += [("geocode_place", {"name": name, "city": self.destination}) for name in sorted(names)]
+        return [ToolCall(f"call_{i}", name, args) for i, (name, args) in enumerate(calls)]
+
+    def _trip(self, days: int, skeleton: bool) -> dict:
+        return {
+            "trip_name": f"{self.destination} {days} 天行程",
+            "flight": {"airline": "EVA Air", "price": "15000", "link": "https://example.com/flight"},
+            "budget_analysis": "機票約 15000，門票與每日花費在預算內。",
+            "total_budget": 15000 + 3000 * days,
+            "activities": [{"name": n, "platform": "klook", "price": "2500", "link": "https://example.com"}
+                           for n in PAID_ATTRACTIONS],
+            "daily_itinerary": [
+                {"day": d, "theme": f"Day {d}", "region": "大阪"} if skeleton
+                else {"day": d, "theme": f"Day {d}", "attractions": self._attractions(d)}
+                for d in range(1, days + 1)
+            ],
+        }
+
+    def _chat(self, messages, tools=None):
+        system, user = messages[0]["content"], messages[1]["content"]
+        tokens = _estimate_tokens(messages)
+
+        if system == get_day_system_prompt():
+            day = int(_DAY_LINE.search(user).group(1))
+            time.sleep(self.round_latency + self.seconds_per_day)
+            answer = {"day": day, "theme": f"Day {day}", "attractions": self._attractions(day)}
+            return ChatTurn(json.dumps(answer, ensure_ascii=False), tokens=tokens)
+
+        match = _DAYS_LINE.search(user)
+        days = int(match.group(1)) if match else 1
+        skeleton = system == get_skeleton_system_prompt()
+        # Research round first, as long as tools are offered and have not been used yet
+        if tools and not any(m.get("role") == "tool" for m in messages):
+            time.sleep(self.round_latency)
+            calls = self._research_calls(0 if skeleton else days)
+            raw = {"role": "assistant", "content": "", "tool_calls": [
+                {"id": c.id, "type": "function", "function": {"name": c.name, "arguments": json.dumps(c.arguments)}}
+                for c in calls
+            ]}
+            return ChatTurn("", calls, raw=raw, tokens=tokens)
+
+        time.sleep(self.round_latency + self.seconds_per_day * (1 if skeleton else days))
+        return ChatTurn(json.dumps(self._trip(days, skeleton), ensure_ascii=False), tokens=tokens)
+
@@ -0,0 +1,135 @@
+"""
+Load test for the provider clients against benchmarks/mock_llm_server.py.
+
+Runs many full plans (tool rounds + final JSON) through GroqService, HuggingFaceService or
+OllamaService at a given concurrency and reports throughput, latency percentiles, failed
+plans and how many injected 429 / 5xx responses the client absorbed with its retries.
+Search results are canned, so only the LLM traffic is measured.
+
+Usage (from the repo root):
+    python -m benchmarks.load_test --provider groq --plans 40 --concurrency 8 --rate-limit-rate 0.1
+    python -m benchmarks.load_test --provider ollama --url http://127.0.0.1:8900   # external mock server
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("TELEMETRY_EXPORT", "off")
+# Always a fresh cache: canned results must never reach the real TOOL_CACHE_PATH
+os.environ["TOOL_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="load-"), "tool_cache.sqlite3")
+
+from src.tools.prompt import get_user_request_prompt
+from src.tools.search_backend import set_search_backend
+from src.llm_services.llm_factory import is_valid_itinerary
+from benchmarks.fakes import CannedSearchBackend
+from benchmarks.run import percentile
+from benchmarks.mock_llm_server import MockBehavior, start_server
+
+
+def make_service(provider: str, url: str):
+    """
+    The same service classes get_llm_service builds, pointed at the mock server
+    """
+    if provider == "groq":
+        from src.llm_services.groq_service import GroqService
+        return GroqService(api_key="mock", base_url=url)
+    if provider == "hf":
+        from src.llm_services.hf_service import HuggingFaceService
+        return HuggingFaceService(api_key="mock", base_url=f"{url}/v1")
+    from src.llm_services.ollama_service import OllamaService
+    return OllamaService(model_name="mock", host=url)
+
+
+def _plan(service, days: int) -> tuple:
+    prompt = get_user_request_prompt("大阪", days, "台北", "2025-01-01", 50000, ["在地美食"])
+    start = time.perf_counter()
+    try:
+        ok = is_valid_itinerary(service.generate_trip(prompt))
+    except Exception as e:
+        print(f"❌ [Load] 規劃失敗: {e}")
+        ok = False
+    return ok, time.perf_counter() - start
+
+
+async def _aplan(service, days: int, semaphore) -> tuple:
+    prompt = get_user_request_prompt("大阪", days, "台北", "2025-01-01", 50000, ["在地美食"])
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            ok = is_valid_itinerary(await service.agenerate_trip(prompt))
+        except Exception as e:
+            print(f"❌ [Load] 規劃失敗: {e}")
+            ok = False
+        return ok, time.perf_counter() - start
+
+
+async def _run_async(service, plans: int, days: int, concurrency: int) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    return await asyncio.gather(*(_aplan(service, days, semaphore) for _ in range(plans)))
+
+
+def server_stats(url: str) -> dict:
+    with urllib.request.urlopen(f"{url}/stats", timeout=5) as response:
+        return json.load(response)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the provider clients against the mock LLM server")
+    parser.add_argument("--provider", choices=["groq", "hf", "ollama"], default="groq")
+    parser.add_argument("--url", help="external mock server; by default one is started in-process")
+    parser.add_argument("--plans", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--days", type=int, default=3)
+    parser.add_argument("--async", dest="use_async", action="store_true", help="use agenerate_trip")
+    parser.add_argument("--search-latency", type=float, default=0.0)
+    # Behavior of the in-process server
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    options = parser.parse_args(argv)
+
+    set_search_backend(CannedSearchBackend(latency=options.search_latency))
+    server = None
+    url = options.url
+    if url is None:
+        behavior = MockBehavior(latency=options.latency, error_rate=options.error_rate,
+                                rate_limit_rate=options.rate_limit_rate, retry_after=options.retry_after,
+                                seed=options.seed)
+        server, url = start_server(behavior)
+    url = url.rstrip("/")
+
+    service = make_service(options.provider, url)
+    before = server_stats(url)
+    start = time.perf_counter()
+    if options.use_async:
+        results = asyncio.run(_run_async(service, options.plans, options.days, options.concurrency))
+    else:
+        with ThreadPoolExecutor(max_workers=options.concurrency) as pool:
+            results = list(pool.map(lambda _: _plan(service, options.days), range(options.plans)))
+    elapsed = time.perf_counter() - start
+    after = server_stats(url)
+
+    if server is not None:
+        server.shutdown()
+
+    latencies = [seconds * 1000 for _, seconds in results]
+    failed = sum(1 for ok, _ in results if not ok)
+    served = {key: after[key] - before.get(key, 0) for key in after}
+    print(f"\n📈 [Load] {options.provider}{' (async)' if options.use_async else ''}: "
+          f"{options.plans} 次規劃 / 並行 {options.concurrency}, {elapsed:.1f}s")
+    print(f"   吞吐量 {options.plans / elapsed:.2f} plans/s, p50 {percentile(latencies, 50):.0f}ms / "
+          f"p95 {percentile(latencies, 95):.0f}ms, 失敗 {failed}")
+    print(f"   伺服器: {served['requests']} 次請求, 429 x {served['ratelimited']}, 5xx x {served['errors']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,280 @@
+"""
+Local stand-in for the chat completion endpoints, for load testing the provider clients.
+
+Speaks enough of both wire formats for GroqService, HuggingFaceService and OllamaService:
+- OpenAI style: POST .../chat/completions (JSON or SSE stream), GET .../models
+- Ollama:       POST /api/chat (JSON or NDJSON stream), GET /api/tags
+The answers come from benchmarks.fakes.ScriptedLLMService (research tool calls, then the
+trip JSON), with configurable latency, injected 5xx errors and 429 rate limits.
+GET /stats returns the request / error counters.
+
+Usage (from the repo root):
+    python -m benchmarks.mock_llm_server --port 8900 --latency 0.3 --error-rate 0.05 --rate-limit-rate 0.1
+
+Point the app (or benchmarks.load_test) at it:
+    GROQ_BASE_URL="http://127.0.0.1:8900"
+    HF_BASE_URL="http://127.0.0.1:8900/v1"
+    OLLAMA_HOST="http://127.0.0.1:8900"
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from benchmarks.fakes import ScriptedLLMService
+
+
+class MockBehavior:
+    """
+    :param latency: seconds per chat round before the answer starts
+    :param seconds_per_day: extra seconds per planned day of a trip answer
+    :param error_rate: share of requests answered with a 500
+    :param rate_limit_rate: share of requests answered with a 429 (+ Retry-After)
+    :param retry_after: seconds sent in the Retry-After header
+    :param chunk_size: characters per streamed chunk
+    :param chunk_delay: seconds between streamed chunks
+    """
+
+    def __init__(self, latency=0.3, seconds_per_day=0.05, error_rate=0.0, rate_limit_rate=0.0,
+                 retry_after=1.0, chunk_size=40, chunk_delay=0.01, seed=None):
+        self.model = ScriptedLLMService(round_latency=latency, seconds_per_day=seconds_per_day)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "completions": 0, "streams": 0, "errors": 0, "ratelimited": 0}
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def fault(self):
+        """
+        :return None, "error" or "ratelimit" for this request
+        """
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return "ratelimit"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "error"
+        return None
+
+    def answer(self, messages: list, tools):
+        # The warm-up request of OllamaService has no user message
+        if len(messages) < 2:
+            time.sleep(self.model.round_latency)
+            return "", []
+        turn = self.model._chat(messages, tools=tools)
+        return turn.content or "", turn.tool_calls
+
+    def chunks(self, text: str):
+        for start in range(0, len(text), self.chunk_size):
+            if start:
+                time.sleep(self.chunk_delay)
+            yield text[start:start + self.chunk_size]
+
+
+def _tokens(messages: list, content: str, tool_calls: list):
+    prompt = sum(len(str(m.get("content") or "")) for m in messages) // 4
+    completion = (len(content) + sum(len(json.dumps(c.arguments)) for c in tool_calls)) // 4
+    return prompt, completion
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    behavior: MockBehavior = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    # === helpers ===
+    def _send_json(self, status: int, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: str):
+        raw = data.encode("utf-8")
+        self.wfile.write(f"{len(raw):x}\r\n".encode("ascii") + raw + b"\r\n")
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _injected_fault(self) -> bool:
+        fault = self.behavior.fault()
+        if fault == "ratelimit":
+            self.behavior.count("ratelimited")
+            self._send_json(429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_exceeded"}},
+                            headers={"Retry-After": str(self.behavior.retry_after)})
+            return True
+        if fault == "error":
+            self.behavior.count("errors")
+            self._send_json(500, {"error": {"message": "Internal server error (mock)", "type": "server_error"}})
+            return True
+        return False
+
+    # === routes ===
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._send_json(200, self.behavior.stats)
+        elif self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]})
+        elif self.path.startswith("/api/tags"):
+            self._send_json(200, {"models": [{"name": "mock", "model": "mock", "size": 0}]})
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        self.behavior.count("requests")
+        request = self._read_json()
+        if self._injected_fault():
+            return
+
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            self._openai_chat(request)
+        elif self.path.startswith("/api/chat"):
+            self._ollama_chat(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _openai_chat(self, request: dict):
+        messages = request.get("messages") or []
+        content, tool_calls = self.behavior.answer(messages, request.get("tools"))
+        prompt_tokens, completion_tokens = _tokens(messages, content, tool_calls)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        calls = [
+            {"id": f"call_{uuid.uuid4().hex[:8]}", "type": "function",
+             "function": {"name": c.name, "arguments": json.dumps(c.arguments, ensure_ascii=False)}}
+            for c in tool_calls
+        ]
+        finish_reason = "tool_calls" if calls else "stop"
+        base = {"id": f"chatcmpl-{uuid.uuid4().hex[:12]}", "created": int(time.time()),
+                "model": request.get("model") or "mock"}
+
+        if not request.get("stream"):
+            self.behavior.count("completions")
+            message = {"role": "assistant", "content": content or None}
+            if calls:
+                message["tool_calls"] = calls
+            self._send_json(200, {**base, "object": "chat.completion", "usage": usage,
+                                  "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}]})
+            return
+
+        self.behavior.count("streams")
+        self._start_stream("text/event-stream")
+
+        def event(delta, finish=None, **extra):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": delta, "finish_reason": finish}], **extra}
+            self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+
+        event({"role": "assistant", "content": ""})
+        for piece in self.behavior.chunks(content):
+            event({"content": piece})
+        if calls:
+            event({"tool_calls": [{"index": i, **call} for i, call in enumerate(calls)]})
+        event({}, finish_reason, usage=usage)
+        self._write_chunk("data: [DONE]\n\n")
+        self._end_stream()
+
+    def _ollama_chat(self, request: dict):
+        messages = request.get("messages") or []
+        content, tool_calls = self.behavior.answer(messages, request.get("tools"))
+        prompt_tokens, completion_tokens = _tokens(messages, content, tool_calls)
+        base = {"model": request.get("model") or "mock",
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        final = {"done": True, "done_reason": "stop", "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens}
+        calls = [{"function": {"name": c.name, "arguments": c.arguments}} for c in tool_calls]
+
+        # Ollama streams by default
+        if request.get("stream") is False:
+            self.behavior.count("completions")
+            message = {"role": "assistant", "content": content}
+            if calls:
+                message["tool_calls"] = calls
+            self._send_json(200, {**base, "message": message, **final})
+            return
+
+        self.behavior.count("streams")
+        self._start_stream("application/x-ndjson")
+        for piece in self.behavior.chunks(content):
+            self._write_chunk(json.dumps({**base, "message": {"role": "assistant", "content": piece}, "done": False},
+                                         ensure_ascii=False) + "\n")
+        # Tool calls arrive whole, on the last message
+        message = {"role": "assistant", "content": ""}
+        if calls:
+            message["tool_calls"] = calls
+        self._write_chunk(json.dumps({**base, "message": message, **final}, ensure_ascii=False) + "\n")
+        self._end_stream()
+
+
+def make_server(behavior: MockBehavior, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    handler = type("BoundMockHandler", (MockHandler,), {"behavior": behavior})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_server(behavior: MockBehavior, host: str = "127.0.0.1", port: int = 0):
+    """
+    Start the server in a daemon thread (port 0 = any free port)
+    :return (server, base_url); server.shutdown() stops it
+    """
+    server = make_server(behavior, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-llm", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible / Ollama chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds per chat round")
+    parser.add_argument("--seconds-per-day", type=float, default=0.05, help="extra seconds per planned day")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds of a 429")
+    parser.add_argument("--chunk-size", type=int, default=40, help="characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.01, help="seconds between streamed chunks")
+    parser.add_argument("--seed", type=int)
+    options = parser.parse_args(argv)
+
+    behavior = MockBehavior(options.latency, options.seconds_per_day, options.error_rate, options.rate_limit_rate,
+                            options.retry_after, options.chunk_size, options.chunk_delay, options.seed)
+    server = make_server(behavior, options.host, options.port)
+    print(f"🧪 [Mock LLM] 監聽 http://{options.host}:{options.port} (OpenAI: /v1/chat/completions, Ollama: /api/chat)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"🧪 [Mock LLM] 結束: {behavior.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Offline end-to-end planner benchmark.
+
+Runs the same pipeline as main.py (prompt -> generate_trip / per-day fan-out ->
+finalize_trip -> coordinate fix-up -> Markdown / PDF / map export) against a scripted
+LLM and canned search results, and reports p50 / p95 latency per stage, tool and LLM
+call counts and peak memory for a short and a 30-day trip.
+
+Usage (from the repo root):
+    python -m benchmarks.run                   # run and compare with benchmarks/baseline.json
+    python -m benchmarks.run --save-baseline   # store the numbers as the new baseline
+    python -m benchmarks.run --iterations 10 --llm-latency 0.5 --search-latency 0.1
+    python -m benchmarks.run --require-baseline   # CI: a missing baseline is an error
+
+Exits with status 1 when a metric is slower / larger than the baseline by more than --tolerance.
+The committed baseline.json was recorded with the default options on a developer machine, so the
+tolerance is relative to that machine: most of the total is the simulated LLM / search latency,
+but parsing and exports are real CPU work. On a much slower or faster machine (or CI runner),
+record a baseline there first with --save-baseline. Scenarios whose stages differ from the
+baseline (e.g. the PDF stage only runs when the CJK font is installed) are not gated.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+# Before any src import: module level settings are read at import time
+os.environ.setdefault("TELEMETRY_EXPORT", "off")
+# Always a fresh cache: canned results must never reach the real TOOL_CACHE_PATH
+os.environ["TOOL_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="bench-"), "tool_cache.sqlite3")
+
+from src.tools.prompt import get_user_request_prompt
+from src.tools.geocoder import fill_missing_coordinates
+from src.tools.tool_cache import get_tool_cache
+from src.tools.search_backend import set_search_backend
+from src.llm_services.fanout import FANOUT_MIN_DAYS, generate_trip_fanout
+from src.llm_services.structured_output import finalize_trip
+from src.export.markdown_utils import create_itinerary_markdown
+from src.export.pdf_generator import convert_json_to_pdf, font_path
+from src.map_utils import render_map
+from src.utils import telemetry
+from benchmarks.fakes import ScriptedLLMService, CannedSearchBackend
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+SCENARIOS = {
+    "short": {"destination": "大阪", "days": 3},
+    "long": {"destination": "大阪", "days": 30},
+}
+STAGES = ["plan", "parse", "markdown", "pdf", "map"]
+# Metrics compared with the baseline (lower is better)
+COMPARED = ["p50_ms", "p95_ms", "peak_memory_mb"]
+
+
+def percentile(values: list, pct: float) -> float:
+    """
+    Nearest-rank percentile
+    """
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def run_pipeline(service, destination: str, days: int) -> dict:
+    """
+    One plan, the way main.py runs it
+    :return {"stages": {stage: ms}, "tool_calls", "llm_calls"}
+    """
+    stages = {}
+    args = (destination, days, "台北", "2025-01-01", 30000 + 3000 * days, ["在地美食", "歷史古蹟"])
+
+    with telemetry.trace("benchmark", days=days) as root:
+        start = time.perf_counter()
+        if days >= FANOUT_MIN_DAYS:
+            raw = generate_trip_fanout(service, *args)
+        else:
+            raw = service.generate_trip(get_user_request_prompt(*args))
+        stages["plan"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trip, _ = finalize_trip(service, raw, destination, days, args[-1])
+        fill_missing_coordinates(trip, destination)
+        stages["parse"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    create_itinerary_markdown(trip)
+    stages["markdown"] = time.perf_counter() - start
+
+    if os.path.exists(font_path):
+        start = time.perf_counter()
+        convert_json_to_pdf(trip)
+        stages["pdf"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    # The HTML is what map_view embeds with components.html
+    render_map(trip).get_root().render()
+    stages["map"] = time.perf_counter() - start
+
+    if len(trip.get("daily_itinerary") or []) != days:
+        raise RuntimeError(f"expected {days} days, got {len(trip.get('daily_itinerary') or [])}")
+
+    spans = telemetry.get_tracer().get_trace(root.trace_id)
+    return {
+        "stages": {name: seconds * 1000 for name, seconds in stages.items()},
+        "tool_calls": sum(1 for s in spans if s["kind"] == "tool"),
+        "llm_calls": sum(1 for s in spans if s["kind"] == "llm"),
+    }
+
+
+def run_scenario(name: str, scenario: dict, options) -> dict:
+    if not os.path.exists(font_path):
+        # Without the CJK font the PDF export fails on the first Chinese character
+        print(f"⚠️ [Bench] 找不到 {font_path}，略過 PDF 階段")
+    service = ScriptedLLMService(round_latency=options.llm_latency, seconds_per_day=options.llm_seconds_per_day,
+                                 destination=scenario["destination"])
+    totals, per_stage, runs = [], {stage: [] for stage in STAGES}, []
+
+    for i in range(options.warmup + options.iterations):
+        if not options.warm_cache:
+            get_tool_cache().clear()
+        run = run_pipeline(service, scenario["destination"], scenario["days"])
+        if i < options.warmup:
+            continue
+        runs.append(run)
+        totals.append(sum(run["stages"].values()))
+        for stage, ms in run["stages"].items():
+            per_stage[stage].append(ms)
+
+    # Peak memory in a separate run: tracemalloc slows everything down
+    if not options.warm_cache:
+        get_tool_cache().clear()
+    tracemalloc.start()
+    run_pipeline(service, scenario["destination"], scenario["days"])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "days": scenario["days"],
+        "iterations": options.iterations,
+        "p50_ms": round(percentile(totals, 50), 1),
+        "p95_ms": round(percentile(totals, 95), 1),
+        "stages": [stage for stage in STAGES if per_stage[stage]],
+        "stages_p50_ms": {stage: round(percentile(values, 50), 1) for stage, values in per_stage.items() if values},
+        "tool_calls": runs[-1]["tool_calls"],
+        "llm_calls": runs[-1]["llm_calls"],
+        "peak_memory_mb": round(peak / 1024 / 1024, 2),
+    }
+    print(f"📊 [Bench] {name} ({scenario['days']} 天): p50 {result['p50_ms']:.0f}ms / p95 {result['p95_ms']:.0f}ms, "
+          f"{result['tool_calls']} 次工具 / {result['llm_calls']} 次 LLM, 峰值記憶體 {result['peak_memory_mb']} MB")
+    return result
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Print the comparison table
+    :return the regressed "scenario.metric" names
+    """
+    regressions = []
+    print(f"\n{'scenario':<10}{'metric':<18}{'baseline':>12}{'current':>12}{'change':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<10}(no baseline)")
+            continue
+
+        # Totals and memory only compare when the same stages ran (no PDF stage without the font)
+        base_stages = base.get("stages") or list(base.get("stages_p50_ms", {}))
+        gated = base_stages == result["stages"]
+        if not gated:
+            print(f"{name:<10}(stages differ from the baseline: {base_stages} vs {result['stages']}, not gated)")
+
+        metrics = [(m, base.get(m), result[m]) for m in COMPARED]
+        metrics += [(f"{stage}_p50_ms", base.get("stages_p50_ms", {}).get(stage), result["stages_p50_ms"].get(stage))
+                    for stage in STAGES]
+        for metric, old, new in metrics:
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ""
+            # Stages are only reported; the totals and memory decide the exit code
+            if gated and metric in COMPARED and change > tolerance:
+                flag = " ❌"
+                regressions.append(f"{name}.{metric}")
+            print(f"{name:<10}{metric:<18}{old:>12.1f}{new:>12.1f}{change:>+10.0%}{flag}")
+
+        for metric in ("tool_calls", "llm_calls"):
+            if base.get(metric) != result[metric]:
+                print(f"{name:<10}{metric:<18}{base.get(metric)!s:>12}{result[metric]:>12}  (changed)")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline end-to-end planner benchmark")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), action="append",
+                        help="run only this scenario (repeatable)")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="seconds per LLM round")
+    parser.add_argument("--llm-seconds-per-day", type=float, default=0.05, help="extra output seconds per planned day")
+    parser.add_argument("--search-latency", type=float, default=0.05, help="seconds per search request")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the tool cache between iterations")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--require-baseline", action="store_true",
+                        help="fail when the baseline file is missing (CI)")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown ratio before failing")
+    parser.add_argument("--output", help="also write the results as JSON to this path")
+    options = parser.parse_args(argv)
+
+    set_search_backend(CannedSearchBackend(latency=options.search_latency))
+
+    results = {name: run_scenario(name, SCENARIOS[name], options) for name in options.scenario or SCENARIOS}
+
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if options.save_baseline:
+        with open(options.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"💾 [Bench] 已儲存 baseline: {options.baseline}")
+        return 0
+
+    if not os.path.exists(options.baseline):
+        if options.require_baseline:
+            print(f"❌ [Bench] 找不到 baseline: {options.baseline}")
+            return 1
+        print("ℹ️ [Bench] 沒有 baseline，使用 --save-baseline 建立")
+        return 0
+
+    with open(options.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, options.tolerance)
+    if regressions:
+        print(f"\n❌ [Bench] 效能退步超過 {options.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\n✅ [Bench] 沒有超出容許範圍的退步")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
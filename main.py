@@ -1,10 +1,10 @@
+import uuid
 import streamlit as st
-import json
-import re
 from dotenv import load_dotenv
 
-from src.llm_services.llm_factory import get_llm_service
-from src.tools.prompt import get_user_request_prompt
+from src.llm_services.llm_factory import warm_up_providers
+from src.llm_services.plan_jobs import get_job_runner, DONE, CANCELLED
+from src.utils.plan_cache import get_plan_cache
 # UI parts
 from src.ui.sidebar import render_sidebar
 from src.ui.header import render_header
@@ -12,6 +12,8 @@ from src.ui.dashboard import render_budget_dashboard
 from src.ui.flight import render_flight_info
 from src.ui.itinerary import render_itinerary
 from src.ui.map_view import render_map_view
+from src.ui.live_view import render_plan_job
+from src.ui.debug_panel import render_trace_waterfall
 
 def run_app():
     load_dotenv()
@@ -34,44 +36,79 @@ def run_app():
 
     if "trip_result" not in st.session_state:
         st.session_state["trip_result"] = None
+    if "trace_id" not in st.session_state:
+        st.session_state["trace_id"] = None
+    if "job_id" not in st.session_state:
+        st.session_state["job_id"] = None
+    if "session_id" not in st.session_state:
+        # Identifies this browser session as a watcher of background plan jobs
+        st.session_state["session_id"] = uuid.uuid4().hex
 
     # render sidebar
     inputs = render_sidebar()
 
+    # Load the Ollama model before the first submit, a cold load adds tens of seconds
+    warm_up_providers(inputs["llm_provider"])
+
+    job_runner = get_job_runner()
+
     # control submission
     if inputs["submit"]:
         if not inputs["destination"]:
             st.warning("請輸入目的地！")
         else:
             try:
-                llm_service = get_llm_service(inputs["llm_provider"])
-                with st.spinner(f"AI 正在根據您的 {inputs['budget']} 元預算進行規劃..."):
-                    user_request = get_user_request_prompt(
-                        inputs["destination"], 
-                        inputs["days"], 
-                        inputs["origin"], 
-                        inputs["start_date"], 
-                        inputs["budget"], 
-                        inputs["interests"]
-                    )
-                    raw_response = llm_service.generate_trip(
-                        user_request, 
-                        enable_flights=inputs["enable_flight_search"]
+                previous_job = st.session_state["job_id"]
+                plan_cache = get_plan_cache()
+                cache_match, cached_trip = plan_cache.get(inputs) if inputs["use_plan_cache"] else (None, None)
+                if cached_trip:
+                    # Same (or nearly the same) request was planned recently, skip the LLM and tools
+                    st.session_state["trip_result"] = cached_trip
+                    if cache_match == "near":
+                        st.info("⚡ 使用相近條件 (預算 / 日期) 的快取行程 (已略過機票與預算分析)，取消勾選「使用快取行程」可重新規劃")
+                    else:
+                        st.info("⚡ 使用快取行程，取消勾選「使用快取行程」可重新規劃")
+                    # Stop following a plan that was still running
+                    if previous_job:
+                        job_runner.cancel(previous_job, st.session_state["session_id"])
+                        st.session_state["job_id"] = None
+                else:
+                    # Plan in the background: reruns from widget interactions no longer block on it or discard it
+                    st.session_state["job_id"] = job_runner.submit(
+                        inputs, st.session_state["session_id"], previous=previous_job
                     )
-                    
-                    # parse json
-                    try:
-                        match = re.search(r"\{.*\}", raw_response, re.DOTALL)
-                        if match:
-                            st.session_state["trip_result"] = json.loads(match.group(0))
-                        else:
-                            raise ValueError("找不到 JSON")
-                    except Exception as e:
-                        st.error("JSON 解析失敗")
-                        st.text(raw_response)
             except Exception as e:
                 st.error(f"錯誤: {e}")
 
+    # follow the background plan job of this session
+    job = job_runner.get(st.session_state["job_id"]) if st.session_state["job_id"] else None
+    if job is not None and not job.finished:
+        render_plan_job(job.id, job.inputs["destination"])
+    elif job is not None:
+        # Finished: take the result once, later reruns only show trip_result
+        st.session_state["job_id"] = None
+        st.session_state["trace_id"] = job.trace_id
+        if job.status == DONE:
+            st.session_state["trip_result"] = job.trip
+            if job.repairs and (job.repairs["days"] or job.repairs["fields"]):
+                st.info(f"🩹 已自動修復：第 {job.repairs['days']} 天 / 欄位 {job.repairs['fields']}")
+        elif job.status == CANCELLED:
+            if job.trip:
+                # Show the finished days instead of throwing them away
+                st.session_state["trip_result"] = job.trip
+                kept = f"🛑 已取消規劃，下方為已完成的 {job.planned_days}/{job.inputs['days']} 天。"
+                if job.resumable:
+                    st.warning(kept + "用相同條件重新規劃時會沿用這些天，只規劃其餘的天數。")
+                else:
+                    st.warning(kept + "重新規劃時會重新產生行程，已查過的搜尋結果則直接使用快取。")
+            else:
+                st.warning("🛑 已取消規劃 (尚未完成任何一天)。已查過的搜尋結果有快取，重新規劃時不必再搜尋。")
+        elif job.raw_response:
+            st.error(f"JSON 解析失敗: {job.error}")
+            st.text(job.raw_response)
+        else:
+            st.error(f"錯誤: {job.error}")
+
     # render the result
     result = st.session_state["trip_result"]
 
@@ -94,5 +131,8 @@ def run_app():
     else:
         st.info("👈 請在左側設定您的預算與偏好，開始 AI 規劃！")
 
+    if inputs["debug"] and st.session_state["trace_id"]:
+        render_trace_waterfall(st.session_state["trace_id"])
+
 if __name__ == "__main__":
     run_app()
\ No newline at end of file
@@ -1,6 +1,12 @@
 from fpdf import FPDF
 import os
+import time
 import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.utils import progress
+from src.utils.render_cache import get_render_cache, content_hash
 
 # 2. 強制關閉 fontTools 的 INFO 訊息
 # 這樣它就不會一直洗版 "subsetting not needed" 了
@@ -69,6 +75,7 @@ def convert_json_to_pdf(trip_data):
 
     # --- 4. 寫入每日行程 ---
     itinerary = trip_data.get('daily_itinerary', [])
+    step = progress.counter("📄 排版 PDF", len(itinerary))
     for day in itinerary:
         day_num = day.get('day', '?')
         theme = day.get('theme', '行程')
@@ -112,6 +119,7 @@ def convert_json_to_pdf(trip_data):
                 pdf.ln(2)
         
         pdf.ln(5)
+        step(f"Day {day_num}")
 
     # --- 5. 寫入票券 ---
     activities = trip_data.get('activities', [])
@@ -131,4 +139,74 @@ def convert_json_to_pdf(trip_data):
             pdf.set_x(pdf.l_margin)
             pdf.multi_cell(pdf.epw, 8, f"• [{platform}] {title} - {price}", new_x="LMARGIN", new_y="NEXT")
 
-    return bytes(pdf.output())
\ No newline at end of file
+    progress.report("📄 輸出檔案...")
+    return bytes(pdf.output())
+
+
+# --- 背景產生 PDF：只在使用者要求時排版，完成的檔案依行程內容存進 render cache ---
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS") or 2)
+MAX_FINISHED_EXPORTS = 50
+
+RUNNING, DONE, FAILED = "running", "done", "failed"
+
+
+class PdfExport:
+    def __init__(self, digest: str):
+        self.digest = digest
+        self.status = RUNNING
+        self.progress = "📄 排隊中..."
+        self.error = None
+        self.created = time.time()
+
+    def report(self, message: str):
+        self.progress = message
+
+
+_exports = OrderedDict()  # content hash -> PdfExport, oldest first
+_exports_lock = threading.Lock()
+_pool = None
+
+
+def _export(job: PdfExport, trip_data: dict):
+    try:
+        with progress.listen(job.report):
+            pdf_bytes = convert_json_to_pdf(trip_data)
+        get_render_cache().set("pdf", job.digest, pdf_bytes)
+        job.status = DONE
+        print(f"📄 [PDF] 已產生 {len(pdf_bytes) / 1024:.0f}KB ({time.time() - job.created:.1f}s)")
+    except Exception as e:
+        print(f"❌ [PDF] 產生失敗: {e}")
+        job.error = str(e)
+        job.status = FAILED
+
+
+def start_pdf_export(trip_data: dict, digest: str = None) -> PdfExport:
+    """
+    在背景產生 PDF；同一份行程正在產生時直接沿用
+    :param digest: content_hash(trip_data) if the caller already has it
+    :return the export job (poll job.status / job.progress, the bytes land in get_render_cache() under "pdf")
+    """
+    global _pool
+    digest = digest or content_hash(trip_data)
+    with _exports_lock:
+        job = _exports.get(digest)
+        if job is not None and job.status == RUNNING:
+            return job
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=PDF_EXPORT_WORKERS, thread_name_prefix="pdf-export")
+        job = PdfExport(digest)
+        _exports.pop(digest, None)
+        _exports[digest] = job
+        finished = [d for d, j in _exports.items() if j.status != RUNNING]
+        for old in finished[:-MAX_FINISHED_EXPORTS]:
+            del _exports[old]
+    _pool.submit(_export, job, trip_data)
+    return job
+
+
+def get_pdf_export(digest: str):
+    """
+    :return the latest export job of this trip, or None
+    """
+    with _exports_lock:
+        return _exports.get(digest)
\ No newline at end of file
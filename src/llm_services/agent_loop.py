@@ -0,0 +1,243 @@
+"""
+Shared multi-round tool calling loop for every BaseLLMService.
+Providers only implement a single chat round; this loop decides when to run
+tools, when to stop, and how to finish gracefully once a budget runs out.
+"""
+import os
+import time
+from dataclasses import dataclass, field
+from src.tools.executor import execute_tool_calls, aexecute_tool_calls
+from src.tools.compaction import compact_tool_results, estimate_tokens
+from src.utils import telemetry
+
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS") or 4)
+AGENT_DEADLINE_SECONDS = float(os.getenv("AGENT_DEADLINE_SECONDS") or 150)
+AGENT_TOKEN_BUDGET = int(os.getenv("AGENT_TOKEN_BUDGET") or 60000)
+
+FINALIZE_PROMPT = (
+    "工具呼叫的額度已用完。請不要再呼叫任何工具，"
+    "直接根據目前已知的資訊輸出完整的最終 JSON 行程 (每一天都要有)，"
+    "不確定的價格或座標請填合理估計值。"
+)
+
+
+@dataclass
+class ToolCall:
+    id: object
+    name: str
+    arguments: object  # JSON string (Groq/HF) or dict (Ollama/Gemini)
+
+
+@dataclass
+class ChatTurn:
+    content: str
+    tool_calls: list = field(default_factory=list)
+    tokens: int = 0
+    raw: object = None  # provider message appended to the history as-is
+
+
+def _exhausted(rounds, start, tokens_used, max_rounds, deadline_seconds, token_budget):
+    """
+    :return the name of the budget that ran out, or None
+    """
+    elapsed = time.monotonic() - start
+    if rounds >= max_rounds:
+        return f"工具回合上限 {max_rounds}"
+    if elapsed >= deadline_seconds:
+        return f"時間上限 {deadline_seconds:.0f}s"
+    if tokens_used >= token_budget:
+        return f"token 上限 {token_budget}"
+    return None
+
+
+def _request_final_answer(messages: list, exhausted: str):
+    # Degrade gracefully: no more tools, ask for the final plan with what we have
+    print(f"⏹️ [Agent] 已達{exhausted}，要求模型直接輸出行程")
+    messages.append({"role": "user", "content": FINALIZE_PROMPT})
+
+
+def _log_done(rounds, start, tokens_used, tokens_saved):
+    print(f"🧮 [Agent] 完成：{rounds} 輪工具呼叫，{time.monotonic() - start:.1f}s，"
+          f"使用 {tokens_used} tokens，壓縮節省 {tokens_saved} tokens")
+    telemetry.annotate(tool_rounds=rounds, tokens=tokens_used, tokens_saved=tokens_saved)
+
+
+def _span_attributes(service) -> dict:
+    model = getattr(service, "model", None)
+    # Gemini keeps a GenerativeModel object here
+    model = getattr(model, "model_name", model)
+    return {"provider": type(service).__name__, "model": str(model) if model else ""}
+
+
+def _cancelled(cancel_event, rounds) -> bool:
+    if cancel_event is not None and cancel_event.is_set():
+        print(f"🛑 [Agent] 已取消 (完成 {rounds} 輪工具呼叫)")
+        return True
+    return False
+
+
+def iter_agent_loop(service, messages: list, tools: list, stream: bool = False, max_rounds: int = MAX_TOOL_ROUNDS,
+                    deadline_seconds: float = AGENT_DEADLINE_SECONDS, token_budget: int = AGENT_TOKEN_BUDGET,
+                    cancel_event=None):
+    """
+    :param service: a BaseLLMService (provides _chat / _chat_stream / _append_assistant / _append_tool_results)
+    :param stream: stream each round's text with service._chat_stream
+    :param cancel_event: threading.Event checked before every round; once set the loop ends with empty output
+    Generator of (event, data):
+      ("delta", text)        streamed text of the current round (stream=True only)
+      ("tool_round", names)  the round ended with tool calls, text streamed in it is not the answer
+      ("done", text)         the final model output (should be the trip JSON)
+    """
+    with telemetry.span("agent_loop", kind="agent", stream=stream, **_span_attributes(service)):
+        yield from _agent_rounds(service, messages, tools, stream, max_rounds, deadline_seconds, token_budget, cancel_event)
+
+
+def _agent_rounds(service, messages, tools, stream, max_rounds, deadline_seconds, token_budget, cancel_event):
+    start = time.monotonic()
+    tokens_used = 0
+    tokens_saved = 0
+    rounds = 0
+
+    while True:
+        if _cancelled(cancel_event, rounds):
+            telemetry.annotate(cancelled=True)
+            yield "done", ""
+            return
+
+        exhausted = _exhausted(rounds, start, tokens_used, max_rounds, deadline_seconds, token_budget)
+        if exhausted:
+            _request_final_answer(messages, exhausted)
+        round_tools = None if exhausted else tools
+
+        with telemetry.span("llm.chat", kind="llm", round=rounds + 1, tools=bool(round_tools),
+                            **_span_attributes(service)) as llm_span:
+            if stream:
+                chunks = service._chat_stream(messages, tools=round_tools)
+                while True:
+                    try:
+                        yield "delta", next(chunks)
+                    except StopIteration as stop:
+                        turn = stop.value
+                        break
+            else:
+                turn = service._chat(messages, tools=round_tools)
+            llm_span.set(tokens=turn.tokens, tool_calls=len(turn.tool_calls))
+        tokens_used += turn.tokens
+
+        if exhausted or not turn.tool_calls:
+            _log_done(rounds, start, tokens_used, tokens_saved)
+            yield "done", turn.content or ""
+            return
+
+        rounds += 1
+        names = [call.name for call in turn.tool_calls]
+        print(f"🔁 [Agent] 第 {rounds} 輪：{', '.join(names)}")
+        yield "tool_round", names
+        service._append_assistant(messages, turn)
+
+        results = execute_tool_calls([(call.id, call.name, call.arguments) for call in turn.tool_calls])
+        compacted, stats = compact_tool_results(results)
+        tokens_saved += stats["tokens_saved"]
+        service._append_tool_results(messages, compacted)
+
+
+def run_agent_loop(service, messages: list, tools: list, **budgets) -> str:
+    """
+    Blocking version of iter_agent_loop
+    :return the final model output (should be the trip JSON)
+    """
+    # Run the generator to the end so its spans are closed
+    output = ""
+    for event, data in iter_agent_loop(service, messages, tools, **budgets):
+        if event == "done":
+            output = data
+    return output
+
+
+async def arun_agent_loop(service, messages: list, tools: list, max_rounds: int = MAX_TOOL_ROUNDS,
+                          deadline_seconds: float = AGENT_DEADLINE_SECONDS, token_budget: int = AGENT_TOKEN_BUDGET,
+                          cancel_event=None) -> str:
+    """
+    Async version of run_agent_loop: awaits service._achat and runs each round's tool calls concurrently
+    :return the final model output (should be the trip JSON)
+    """
+    with telemetry.span("agent_loop", kind="agent", stream=False, **_span_attributes(service)):
+        return await _aagent_rounds(service, messages, tools, max_rounds, deadline_seconds, token_budget, cancel_event)
+
+
+async def _aagent_rounds(service, messages, tools, max_rounds, deadline_seconds, token_budget, cancel_event):
+    start = time.monotonic()
+    tokens_used = 0
+    tokens_saved = 0
+    rounds = 0
+
+    while True:
+        if _cancelled(cancel_event, rounds):
+            telemetry.annotate(cancelled=True)
+            return ""
+
+        exhausted = _exhausted(rounds, start, tokens_used, max_rounds, deadline_seconds, token_budget)
+        if exhausted:
+            _request_final_answer(messages, exhausted)
+
+        with telemetry.span("llm.chat", kind="llm", round=rounds + 1, tools=not exhausted,
+                            **_span_attributes(service)) as llm_span:
+            turn = await service._achat(messages, tools=None if exhausted else tools)
+            llm_span.set(tokens=turn.tokens, tool_calls=len(turn.tool_calls))
+        tokens_used += turn.tokens
+
+        if exhausted or not turn.tool_calls:
+            _log_done(rounds, start, tokens_used, tokens_saved)
+            return turn.content or ""
+
+        rounds += 1
+        print(f"🔁 [Agent] 第 {rounds} 輪：{', '.join(call.name for call in turn.tool_calls)}")
+        service._append_assistant(messages, turn)
+
+        results = await aexecute_tool_calls([(call.id, call.name, call.arguments) for call in turn.tool_calls])
+        compacted, stats = compact_tool_results(results)
+        tokens_saved += stats["tokens_saved"]
+        service._append_tool_results(messages, compacted)
+
+
+def stream_openai_chunks(chunks):
+    """
+    Relay an OpenAI-style chat completion stream (Groq / Hugging Face).
+    Yields text deltas and returns the assembled ChatTurn (tool call pieces are merged by index).
+    """
+    text = ""
+    calls = {}
+    usage = None
+    for chunk in chunks:
+        # Usage arrives on the last chunk (OpenAI include_usage, or Groq's x_groq.usage)
+        usage = getattr(chunk, "usage", None) or getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            text += delta.content
+            yield delta.content
+        for piece in (delta.tool_calls or []):
+            call = calls.setdefault(piece.index, {"id": None, "name": "", "arguments": ""})
+            call["id"] = piece.id or call["id"]
+            if piece.function:
+                call["name"] += piece.function.name or ""
+                args = piece.function.arguments or ""
+                # Some providers send the arguments as one dict instead of string pieces
+                call["arguments"] = args if isinstance(args, dict) else call["arguments"] + args
+
+    ordered = [calls[index] for index in sorted(calls)]
+    return ChatTurn(
+        content=text,
+        tool_calls=[ToolCall(call["id"], call["name"], call["arguments"]) for call in ordered],
+        tokens=usage.total_tokens if usage else estimate_tokens(text) + sum(estimate_tokens(str(call["arguments"])) for call in ordered),
+        raw={
+            "role": "assistant",
+            "content": text or None,
+            "tool_calls": [
+                {"id": call["id"], "type": "function",
+                 "function": {"name": call["name"], "arguments": call["arguments"]}}
+                for call in ordered
+            ] or None
+        }
+    )
@@ -1,13 +1,145 @@
+import asyncio
+import inspect
 from abc import ABC, abstractmethod
+from src.tools.prompt import get_system_prompt, get_flight_instruction
+from .agent_loop import ChatTurn, run_agent_loop, iter_agent_loop, arun_agent_loop
+
+# Keeps a reference to background close tasks until they finish (the loop only holds weak ones)
+_closing_tasks = set()
+
 
 class BaseLLMService(ABC):
     """
     Interface for all llm services.
+    A provider only implements one chat round (`_chat`); the shared agent loop
+    runs the tool rounds and enforces the round / time / token budgets.
     """
-    
-    @abstractmethod
-    def generate_trip(self, user_prompt: str, enable_flights: bool = True) -> str:
+    tools = []
+    # Providers with a native async client set self.async_client (used by _achat)
+    async_client = None
+
+    def _build_messages(self, user_prompt: str, enable_flights: bool) -> list:
+        # Static system prompt first, every per-request value at the end (prefix cache friendly)
+        return [
+            {"role": "system", "content": get_system_prompt()},
+            {"role": "user", "content": f"{user_prompt}\n    {get_flight_instruction(enable_flights)}\n"}
+        ]
+
+    def generate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        """
+        :param cancel_event: optional threading.Event, stops the agent loop before its next round
+        :return json structure
+        """
+        return run_agent_loop(self, self._build_messages(user_prompt, enable_flights), self.tools,
+                              cancel_event=cancel_event)
+
+    def complete(self, system_prompt: str, user_prompt: str, use_tools: bool = True, cancel_event=None) -> str:
+        """
+        Run the agent loop with custom prompts (used by the per-day fan-out)
+        :param use_tools: False = a single round that must answer directly
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        return run_agent_loop(self, messages, self.tools if use_tools else None, cancel_event=cancel_event)
+
+    def generate_trip_stream(self, user_prompt: str, enable_flights: bool = True, cancel_event=None):
+        """
+        Streaming mode, generator of (event, data): ("delta", text) / ("tool_round", names) / ("done", text)
+        """
+        return iter_agent_loop(self, self._build_messages(user_prompt, enable_flights), self.tools, stream=True,
+                               cancel_event=cancel_event)
+
+    async def agenerate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
         """
+        Async version of generate_trip, many plans can be in flight on one event loop
         :return json structure
         """
-        pass
\ No newline at end of file
+        return await arun_agent_loop(self, self._build_messages(user_prompt, enable_flights), self.tools,
+                                     cancel_event=cancel_event)
+
+    def health_check(self) -> bool:
+        """
+        Cheap request proving the client still works (used by the service pool before reusing an idle service)
+        """
+        return True
+
+    def close(self):
+        """
+        Release the provider clients' connections (the sync client and the async_client)
+        """
+        close = getattr(getattr(self, "client", None), "close", None)
+        if callable(close):
+            close()
+        self._close_async_client()
+
+    async def _aclose(self):
+        """
+        Close the async client; SDKs expose either `async close()` or a plain close()
+        """
+        result = self.async_client.close()
+        if inspect.isawaitable(result):
+            await result
+
+    def _close_async_client(self):
+        """
+        Loop-safe close of async_client: the pool may evict a service from a plain thread
+        or from inside a running event loop
+        """
+        if self.async_client is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+        if loop is None:
+            asyncio.run(self._aclose())
+        else:
+            # Cannot block the loop we are running on: close on it in the background
+            task = loop.create_task(self._aclose())
+            _closing_tasks.add(task)
+            task.add_done_callback(_closing_tasks.discard)
+
+    @abstractmethod
+    def _chat(self, messages: list, tools: list = None) -> ChatTurn:
+        """
+        One completion round.
+        :param tools: None means the model must answer without calling tools
+        """
+        pass
+
+    async def _achat(self, messages: list, tools: list = None) -> ChatTurn:
+        """
+        Async completion round.
+        Default for providers without an async client: run _chat in a worker thread.
+        """
+        return await asyncio.to_thread(self._chat, messages, tools)
+
+    def _chat_stream(self, messages: list, tools: list = None):
+        """
+        Streaming completion round: yields text deltas and returns the ChatTurn.
+        Default for providers without streaming: the whole answer at once.
+        """
+        turn = self._chat(messages, tools)
+        if turn.content and not turn.tool_calls:
+            yield turn.content
+        return turn
+
+    def _append_assistant(self, messages: list, turn: ChatTurn):
+        """
+        Add the assistant message that requested the tool calls to the history
+        """
+        messages.append(turn.raw)
+
+    def _append_tool_results(self, messages: list, results: list):
+        """
+        :param results: list of (tool_call_id, fn_name, content_str)
+        """
+        for call_id, fn_name, content in results:
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call_id,
+                "name": fn_name,
+                "content": content
+            })
\ No newline at end of file
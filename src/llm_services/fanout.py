@@ -0,0 +1,147 @@
+"""
+Per-day fan-out planning for long trips.
+One completion for a 30-day trip hits max_tokens and is slow, so:
+1. a short skeleton (flight, tickets, budget, and a theme / region per day) with tools
+2. every day's attractions in parallel requests without tools
+3. merge back into the usual trip JSON
+Latency then grows with the slowest day instead of with the total output length.
+"""
+import os
+import copy
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from src.tools.prompt import (
+    get_skeleton_system_prompt,
+    get_skeleton_request_prompt,
+    get_day_system_prompt,
+    get_day_request_prompt,
+)
+from src.llm_services.structured_output import extract_json
+from src.utils import telemetry
+
+# Trips with at least this many days are planned with the fan-out
+FANOUT_MIN_DAYS = int(os.getenv("FANOUT_MIN_DAYS") or 6)
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS") or 4)
+DAY_RETRIES = 1
+
+
+def build_outline(skeleton: dict, days: int) -> list:
+    """
+    Exactly `days` entries numbered 1..days, whatever the skeleton returned
+    """
+    by_day = {}
+    for idx, entry in enumerate(skeleton.get("daily_itinerary") or []):
+        if not isinstance(entry, dict):
+            continue
+        try:
+            number = int(entry.get("day") or idx + 1)
+        except (TypeError, ValueError):
+            number = idx + 1
+        by_day.setdefault(number, entry)
+
+    return [
+        {
+            "day": n,
+            "theme": (by_day.get(n) or {}).get("theme") or "自由探索",
+            "region": (by_day.get(n) or {}).get("region") or "",
+        }
+        for n in range(1, days + 1)
+    ]
+
+
+def plan_day(service, destination, interests, day: dict, outline: list, cancel_event=None) -> dict:
+    with telemetry.span("fanout.day", kind="plan", day=day["day"]):
+        return _plan_day(service, destination, interests, day, outline, cancel_event)
+
+
+def _plan_day(service, destination, interests, day, outline, cancel_event):
+    prompt = get_day_request_prompt(destination, interests, day, outline)
+    for attempt in range(DAY_RETRIES + 1):
+        if cancel_event is not None and cancel_event.is_set():
+            break
+        if attempt:
+            telemetry.count("retries")
+        try:
+            text = service.complete(get_day_system_prompt(), prompt, use_tools=False, cancel_event=cancel_event)
+        except Exception as e:
+            print(f"⚠️ [Fan-out] 第 {day['day']} 天規劃失敗 (第 {attempt + 1} 次): {e}")
+            continue
+
+        data = extract_json(text) or {}
+        # Some models wrap the day in a one-day daily_itinerary
+        if "attractions" not in data and isinstance(data.get("daily_itinerary"), list) and data["daily_itinerary"]:
+            data = data["daily_itinerary"][0] if isinstance(data["daily_itinerary"][0], dict) else {}
+        if isinstance(data.get("attractions"), list):
+            return {"day": day["day"], "theme": data.get("theme") or day["theme"], "attractions": data["attractions"]}
+        print(f"⚠️ [Fan-out] 第 {day['day']} 天輸出格式錯誤 (第 {attempt + 1} 次)")
+
+    # Keep the day so the trip still has every day; the skeleton theme tells the user what was planned
+    return {"day": day["day"], "theme": day["theme"], "attractions": []}
+
+
+def iter_fanout_trip(service, destination, days, origin, start_date, budget, interests,
+                     enable_flights: bool = True, cancel_event=None, resume: dict = None):
+    """
+    Generator of (event, data):
+      ("status", text)      progress message
+      ("skeleton", dict)    the parsed skeleton (before any day is planned)
+      ("day", day)          one finished day (in completion order, not day order)
+      ("done", text)        the merged trip JSON
+    :param resume: {"skeleton": dict, "days": [day]} kept from a cancelled run of the same request;
+                   its skeleton and finished days are reused instead of asking the model again
+    """
+    resume = copy.deepcopy(resume) if resume else {}
+    skeleton = resume.get("skeleton")
+    if skeleton is not None:
+        yield "status", "♻️ 沿用先前取消時的行程骨架..."
+    else:
+        yield "status", "🧭 規劃行程骨架 (每日主題與區域)..."
+        skeleton_text = service.complete(
+            get_skeleton_system_prompt(),
+            get_skeleton_request_prompt(destination, days, origin, start_date, budget, interests, enable_flights),
+            cancel_event=cancel_event
+        )
+        skeleton = extract_json(skeleton_text)
+        if skeleton is None:
+            # Let the caller show the raw output as with any unparsable answer
+            yield "done", skeleton_text
+            return
+    yield "skeleton", copy.deepcopy(skeleton)
+
+    outline = build_outline(skeleton, days)
+    finished = {day["day"]: day for day in resume.get("days") or []
+                if day.get("attractions") and 1 <= day.get("day", 0) <= days}
+    planned = []
+    for day in finished.values():
+        planned.append(day)
+        yield "day", day
+    yield "status", f"🗓️ 平行規劃 {days - len(finished)} 天的景點..."
+
+    with ThreadPoolExecutor(max_workers=FANOUT_MAX_WORKERS, thread_name_prefix="fanout") as pool:
+        futures = [
+            telemetry.submit(pool, plan_day, service, destination, interests, day, outline, cancel_event)
+            for day in outline if day["day"] not in finished
+        ]
+        for future in as_completed(futures):
+            day = future.result()
+            planned.append(day)
+            print(f"📅 [Fan-out] 第 {day['day']} 天完成 ({len(planned)}/{days})")
+            yield "day", day
+
+    skeleton["daily_itinerary"] = sorted(planned, key=lambda d: d["day"])
+    yield "done", json.dumps(skeleton, ensure_ascii=False)
+
+
+def generate_trip_fanout(service, destination, days, origin, start_date, budget, interests,
+                         enable_flights: bool = True, cancel_event=None) -> str:
+    """
+    Blocking version of iter_fanout_trip
+    :return the merged trip JSON
+    """
+    # Run the generator to the end so its spans are closed
+    output = ""
+    for event, data in iter_fanout_trip(service, destination, days, origin, start_date, budget, interests,
+                                        enable_flights, cancel_event):
+        if event == "done":
+            output = data
+    return output
@@ -1,8 +1,8 @@
 import google.generativeai as genai
 import json
 from .base_service import BaseLLMService
+from .agent_loop import ChatTurn, ToolCall
 from src.tools.tools import *
-from src.tools.prompt import *
 
 class GeminiService(BaseLLMService):
     def __init__(self, api_key):
@@ -11,38 +11,151 @@ class GeminiService(BaseLLMService):
         self.tools = [
             search_flights, 
             search_activity_tickets,
+            search_activity_tickets_batch,
             search_flight_average_cost,
             search_internet,
-            search_internet_average_cost
+            search_internet_average_cost,
+            geocode_place
         ]
         
         self.model = genai.GenerativeModel(
             'gemini-2.5-flash', 
             tools=self.tools
         )
-        
-        # Automatic Function Calling
-        self.chat = self.model.start_chat(enable_automatic_function_calling=True)
 
-    def generate_trip(self, user_prompt: str, enable_flights: bool = True) -> str:
+    def health_check(self):
+        genai.get_model(self.model.model_name)
+        return True
+
+    def generate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
         """
         Generate the journey
         """
-        full_prompt = get_system_prompt(enable_flights)
-        
         try:
-            # The SDK will call functions automatically
-            response = self.chat.send_message(f"{full_prompt}\n\n使用者需求: {user_prompt}")
-            return response.text
+            # Function calling is driven by the shared agent loop (not the SDK's automatic mode),
+            # so Gemini gets the same round / time / token budgets as the other providers
+            return super().generate_trip(user_prompt, enable_flights, cancel_event)
             
         except Exception as e:
-            error_msg = str(e)
-            print(f"❌ [Gemini Error] {error_msg}")
-            
-            # Fake JSON for error case
-            return json.dumps({
-                "trip_name": "規劃失敗 (Gemini)",
-                "daily_itinerary": [],
-                "activities": [],
-                "budget_analysis": f"Gemini API 呼叫發生錯誤：{error_msg}。請檢查 API Key 或網路連線。"
-            }, ensure_ascii=False)
\ No newline at end of file
+            return self._error_json(e)
+
+    async def agenerate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        try:
+            return await super().agenerate_trip(user_prompt, enable_flights, cancel_event)
+        except Exception as e:
+            return self._error_json(e)
+
+    @staticmethod
+    def _error_json(e):
+        error_msg = str(e)
+        print(f"❌ [Gemini Error] {error_msg}")
+        
+        # Fake JSON for error case
+        return json.dumps({
+            "trip_name": "規劃失敗 (Gemini)",
+            "daily_itinerary": [],
+            "activities": [],
+            "budget_analysis": f"Gemini API 呼叫發生錯誤：{error_msg}。請檢查 API Key 或網路連線。"
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _to_contents(messages):
+        """
+        Chat history -> Gemini contents. Plain dicts are text turns (the system prompt is
+        merged into the first user turn, as before); Gemini Content objects pass through.
+        """
+        contents = []
+        system_text = ""
+        for message in messages:
+            if not isinstance(message, dict):
+                contents.append(message)
+            elif message["role"] == "system":
+                system_text = message["content"]
+            else:
+                text = message["content"]
+                if system_text:
+                    text = f"{system_text}\n\n使用者需求: {text}"
+                    system_text = ""
+                contents.append({"role": "user", "parts": [text]})
+        return contents
+
+    @staticmethod
+    def _tool_config(tools):
+        # The model always knows the tools; for the final round we just forbid calling them
+        return {"function_calling_config": {"mode": "AUTO" if tools else "NONE"}}
+
+    def _chat(self, messages, tools=None):
+        return self._to_turn(self.model.generate_content(
+            self._to_contents(messages),
+            tool_config=self._tool_config(tools)
+        ))
+
+    async def _achat(self, messages, tools=None):
+        return self._to_turn(await self.model.generate_content_async(
+            self._to_contents(messages),
+            tool_config=self._tool_config(tools)
+        ))
+
+    @staticmethod
+    def _to_turn(response):
+        content = response.candidates[0].content
+        tool_calls = []
+        text = ""
+        for idx, part in enumerate(content.parts):
+            if part.function_call.name:
+                args = type(part.function_call).to_dict(part.function_call).get("args") or {}
+                tool_calls.append(ToolCall(idx, part.function_call.name, args))
+            elif part.text:
+                text += part.text
+
+        usage = getattr(response, "usage_metadata", None)
+        return ChatTurn(
+            content=text,
+            tool_calls=tool_calls,
+            tokens=usage.total_token_count if usage else 0,
+            raw=content
+        )
+
+    def _chat_stream(self, messages, tools=None):
+        response = self.model.generate_content(
+            self._to_contents(messages),
+            tool_config=self._tool_config(tools),
+            stream=True
+        )
+
+        parts = []
+        tool_calls = []
+        text = ""
+        for chunk in response:
+            if not chunk.candidates:
+                continue
+            for part in chunk.candidates[0].content.parts:
+                parts.append(part)
+                if part.function_call.name:
+                    args = type(part.function_call).to_dict(part.function_call).get("args") or {}
+                    tool_calls.append(ToolCall(len(tool_calls), part.function_call.name, args))
+                elif part.text:
+                    text += part.text
+                    yield part.text
+
+        usage = getattr(response, "usage_metadata", None)
+        return ChatTurn(
+            content=text,
+            tool_calls=tool_calls,
+            tokens=usage.total_token_count if usage else 0,
+            # Rebuild the whole model turn from the streamed parts for the history
+            raw=genai.protos.Content(role="model", parts=parts)
+        )
+
+    def _append_tool_results(self, messages, results):
+        # Gemini expects all function responses of one turn in a single Content
+        messages.append(genai.protos.Content(
+            role="user",
+            parts=[
+                genai.protos.Part(function_response=genai.protos.FunctionResponse(
+                    name=fn_name,
+                    response={"result": content}
+                ))
+                for _, fn_name, content in results
+            ]
+        ))
\ No newline at end of file
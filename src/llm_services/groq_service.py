@@ -1,82 +1,69 @@
 import os
-import json
 import streamlit as st
-from groq import Groq
-from src.tools.tools import *
-from src.tools.prompt import *
+from groq import Groq, AsyncGroq
+from .base_service import BaseLLMService
+from .agent_loop import ChatTurn, ToolCall, stream_openai_chunks
 from src.tools.tools_list import get_tool_lists
 
-class GroqService:
-    def __init__(self):
+class GroqService(BaseLLMService):
+    def __init__(self, api_key=None, base_url=None):
+        """
+        :param base_url: another OpenAI-compatible server (e.g. benchmarks/mock_llm_server.py), None = Groq
+        """
+        api_key = api_key or st.secrets['GROQ_API_KEY'] or os.getenv("GROQ_API_KEY")
         self.client = Groq(
-            api_key= st.secrets['GROQ_API_KEY'] or os.getenv("GROQ_API_KEY"),
+            api_key=api_key,
+            base_url=base_url,
         )
+        self.async_client = AsyncGroq(api_key=api_key, base_url=base_url)
         self.model = "llama-3.3-70b-versatile" 
 
         self.tools = get_tool_lists()
-        
-    def generate_trip(self, user_prompt, enable_flights=True):
-        """
-        Tool Calling Loop
-        """
-
-        system_prompt = get_system_prompt(enable_flights)
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
 
+    def health_check(self):
+        self.client.models.list()
+        return True
 
-        response = self.client.chat.completions.create(
+    def _request(self, messages, tools=None, **extra):
+        kwargs = {}
+        if tools:
+            kwargs = {"tools": tools, "tool_choice": "auto"}
+        elif not extra.get("stream"):
+            # No tools to call: the answer must be JSON, let the API enforce it
+            kwargs = {"response_format": {"type": "json_object"}}
+        return dict(
             model=self.model,
             messages=messages,
-            tools=self.tools,
-            tool_choice="auto",
             temperature=0.2, # Lower down the randomness
-            max_tokens=4096
+            max_tokens=4096,
+            **kwargs,
+            **extra
         )
-        response_message = response.choices[0].message
-        # Whether LLM wants to use tools
-        tool_calls = response_message.tool_calls
-
-        # If it wants to call tools
-        if tool_calls:
-            # Append the response to chat history
-            messages.append(response_message)
 
-            # Execute all tools used
-            for tool_call in tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
+    def _chat(self, messages, tools=None):
+        """
+        One completion round, the tool calling loop lives in BaseLLMService
+        """
+        return self._to_turn(self.client.chat.completions.create(**self._request(messages, tools)))
 
-                if fn_name == "search_flights":
-                    res = search_flights(**fn_args)
-                elif fn_name == "search_activity_tickets":
-                    res = search_activity_tickets(**fn_args)
-                elif fn_name == "search_flight_average_cost":
-                    res = search_flight_average_cost(**fn_args)
-                elif fn_name == "search_internet":  # <--- 新增這個判斷
-                    res = search_internet(**fn_args)
-                else:
-                    res = {"error": "Unknown tool"}
+    async def _achat(self, messages, tools=None):
+        return self._to_turn(await self.async_client.chat.completions.create(**self._request(messages, tools)))
 
-                # Add the result of tools to the history
-                messages.append({
-                    "tool_call_id": tool_call.id,
-                    "role": "tool",
-                    "name": fn_name,
-                    "content": json.dumps(res, ensure_ascii=False)
-                })
+    @staticmethod
+    def _to_turn(response):
+        response_message = response.choices[0].message
 
-            # 4. Add the results from tools to the LLM
-            final_response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.2
-            )
-            return final_response.choices[0].message.content
+        return ChatTurn(
+            content=response_message.content,
+            # Whether LLM wants to use tools
+            tool_calls=[
+                ToolCall(tool_call.id, tool_call.function.name, tool_call.function.arguments)
+                for tool_call in (response_message.tool_calls or [])
+            ],
+            tokens=response.usage.total_tokens if response.usage else 0,
+            raw=response_message
+        )
 
-        # If there are no tool calls, return directly
-        else:
-            return response_message.content
\ No newline at end of file
+    def _chat_stream(self, messages, tools=None):
+        stream = self.client.chat.completions.create(**self._request(messages, tools, stream=True))
+        return (yield from stream_openai_chunks(stream))
\ No newline at end of file
@@ -1,71 +1,63 @@
 import os
-import json
 import streamlit as st
-from huggingface_hub import InferenceClient
+from huggingface_hub import InferenceClient, AsyncInferenceClient
 from .base_service import BaseLLMService
-from src.tools.tools import search_flights, search_activity_tickets, search_flight_average_cost, search_internet
-from src.tools.prompt import *
+from .agent_loop import ChatTurn, ToolCall, stream_openai_chunks
 from src.tools.tools_list import get_tool_lists
 
 class HuggingFaceService(BaseLLMService):
-    def __init__(self):
-        self.client = InferenceClient(api_key=(st.secrets['HF_TOKEN'] or os.getenv("HF_TOKEN")))
+    def __init__(self, api_key=None, base_url=None):
+        """
+        :param base_url: another OpenAI-compatible server (e.g. benchmarks/mock_llm_server.py), None = HF router
+        """
+        api_key = api_key or st.secrets['HF_TOKEN'] or os.getenv("HF_TOKEN")
+        self.client = InferenceClient(api_key=api_key, base_url=base_url)
+        self.async_client = AsyncInferenceClient(api_key=api_key, base_url=base_url)
         self.model = "meta-llama/Llama-3.3-70B-Instruct:groq"
 
         self.tools = get_tool_lists()
 
-    def generate_trip(self, user_prompt: str, enable_flights: bool = True) -> str:        
-        system_prompt = get_system_prompt(enable_flights)
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
-        
-        response = self.client.chat_completion(
+    def _request(self, messages, tools=None, **extra):
+        kwargs = {}
+        if tools:
+            kwargs = {"tools": tools, "tool_choice": "auto"}
+        elif not extra.get("stream"):
+            # No tools to call: the answer must be JSON, let the API enforce it
+            kwargs = {"response_format": {"type": "json_object"}}
+        return dict(
             model=self.model,
             messages=messages,
-            tools=self.tools,
-            tool_choice="auto",
             max_tokens=4000,
-            temperature=0.2
+            temperature=0.2,
+            **kwargs,
+            **extra
         )
 
-        message = response.choices[0].message
-        tool_calls = message.tool_calls
+    def _chat(self, messages, tools=None):
+        return self._to_turn(self.client.chat_completion(**self._request(messages, tools)))
 
-        if tool_calls:
-            messages.append(message)
-            
-            for tool_call in tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-                print(f"🤗 [HF] 呼叫工具: {fn_name}")
+    async def _achat(self, messages, tools=None):
+        return self._to_turn(await self.async_client.chat_completion(**self._request(messages, tools)))
 
-                if fn_name == "search_flights":
-                    res = search_flights(**fn_args)
-                elif fn_name == "search_activity_tickets":
-                    res = search_activity_tickets(**fn_args)
-                elif fn_name == "search_flight_average_cost":
-                    res = search_flight_average_cost(**fn_args)
-                elif fn_name == "search_internet":
-                    res = search_internet(**fn_args)
-                else:
-                    res = {"error": "Unknown tool"}
-                
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": fn_name,
-                    "content": json.dumps(res, ensure_ascii=False)
-                })
+    @staticmethod
+    def _to_turn(response):
+        message = response.choices[0].message
+        tool_calls = message.tool_calls or []
+        for tool_call in tool_calls:
+            print(f"🤗 [HF] 呼叫工具: {tool_call.function.name}")
+
+        return ChatTurn(
+            content=message.content,
+            tool_calls=[
+                ToolCall(tool_call.id, tool_call.function.name, tool_call.function.arguments)
+                for tool_call in tool_calls
+            ],
+            tokens=response.usage.total_tokens if response.usage else 0,
+            raw=message
+        )
 
-            final_response = self.client.chat_completion(
-                model=self.model,
-                messages=messages,
-                max_tokens=4000,
-                temperature=0.2
-            )
-            return final_response.choices[0].message.content
-        
-        return message.content
\ No newline at end of file
+    def _chat_stream(self, messages, tools=None):
+        stream = self.client.chat_completion(
+            **self._request(messages, tools, stream=True, stream_options={"include_usage": True})
+        )
+        return (yield from stream_openai_chunks(stream))
\ No newline at end of file
@@ -1,25 +1,353 @@
 import os
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import streamlit as st
+from src.utils import telemetry
+from .base_service import BaseLLMService
+from .structured_output import extract_json
 from .gemini_service import GeminiService
 from .groq_service import GroqService
 from .hf_service import HuggingFaceService
 from .ollama_service import OllamaService
 
-def get_llm_service(provider: str):
-    if provider == "Google Gemini":
+# Idle services (and their HTTP connections) are dropped after this long
+LLM_POOL_MAX_IDLE_SECONDS = float(os.getenv("LLM_POOL_MAX_IDLE_SECONDS") or 900)
+# A service idle for longer than this is health checked before it is reused
+LLM_HEALTH_CHECK_AFTER_SECONDS = float(os.getenv("LLM_HEALTH_CHECK_AFTER_SECONDS") or 120)
+# Other OpenAI-compatible servers for load testing (benchmarks/mock_llm_server.py); Ollama uses OLLAMA_HOST
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+HF_BASE_URL = os.getenv("HF_BASE_URL") or None
+
+HEDGED_PROVIDER = "Hedged (自動備援)"
+HEDGE_PRIMARY = os.getenv("HEDGE_PRIMARY") or "Groq (LPU)"
+HEDGE_SECONDARY = os.getenv("HEDGE_SECONDARY") or "Google Gemini"
+# Until the primary has enough samples, hedge after this many seconds
+HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("HEDGE_DEFAULT_DELAY_SECONDS") or 60)
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE") or 0.95)
+HEDGE_MIN_SAMPLES = 5
+
+# Ollama provider to preload at app start even when another provider is selected (e.g. "Local Ollama (Llama 3.1)")
+OLLAMA_WARMUP_PROVIDER = os.getenv("OLLAMA_WARMUP_PROVIDER") or ""
+
+
+class ServicePool:
+    """
+    Process-wide pool of provider services. Each service owns its SDK client(s),
+    so reusing it keeps the keep-alive HTTP connections instead of paying
+    connection setup and TLS on every submit.
+    Keyed by (provider, model, credentials hash).
+    """
+
+    def __init__(self, max_idle: float = LLM_POOL_MAX_IDLE_SECONDS, health_check_after: float = LLM_HEALTH_CHECK_AFTER_SECONDS):
+        self.max_idle = max_idle
+        self.health_check_after = health_check_after
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [service, last_used]
+
+    @staticmethod
+    def make_key(provider: str, model, *credentials) -> tuple:
+        secret = hashlib.sha256("\0".join(str(c or "") for c in credentials).encode("utf-8")).hexdigest()
+        return provider, model, secret
+
+    def get(self, key: tuple, factory, health_check: bool = True):
+        """
+        :param factory: builds a new service when the key is missing, idle too long or unhealthy
+        :param health_check: False skips the (blocking) health check of an idle service
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._entries.get(key)
+
+        if (entry is not None and health_check and now - entry[1] > self.health_check_after
+                and not self._healthy(entry[0])):
+            print(f"🩺 [LLM Pool] {key[0]} 健康檢查失敗，重新建立連線")
+            self.invalidate(key)
+            entry = None
+
+        if entry is None:
+            service = factory()
+            with self._lock:
+                # Another session may have built one meanwhile, keep the first
+                entry = self._entries.setdefault(key, [service, now])
+            if entry[0] is not service:
+                self._close(service)
+            else:
+                print(f"🔌 [LLM Pool] 建立 {key[0]} 連線 (model: {key[1] or 'default'})")
+
+        entry[1] = now
+        return entry[0]
+
+    def invalidate(self, key: tuple):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._close(entry[0])
+
+    def _evict_idle(self, now: float):
+        # Caller holds the lock
+        for key in [k for k, (_, last_used) in self._entries.items() if now - last_used > self.max_idle]:
+            service, _ = self._entries.pop(key)
+            print(f"🧹 [LLM Pool] 釋放閒置的 {key[0]} 連線")
+            self._close(service)
+
+    @staticmethod
+    def _healthy(service) -> bool:
+        try:
+            return service.health_check()
+        except Exception as e:
+            print(f"⚠️ [LLM Pool] 健康檢查錯誤: {e}")
+            return False
+
+    @staticmethod
+    def _close(service):
+        try:
+            service.close()
+        except Exception as e:
+            print(f"⚠️ [LLM Pool] 關閉連線失敗: {e}")
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            # idle seconds per pooled service; only a prefix of the credentials hash is shown
+            return {f"{key[0]}/{key[1] or 'default'}/{key[2][:8]}": round(now - last_used, 1)
+                    for key, (_, last_used) in self._entries.items()}
+
+
+class LatencyTracker:
+    """
+    Sliding window of planning latencies per provider (failed and out-raced attempts
+    count with the time they took, so a slow primary raises its own p95)
+    """
+
+    def __init__(self, window: int = 50):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self.window = window
+
+    def record(self, provider: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, provider: str, q: float = HEDGE_PERCENTILE):
+        """
+        :return the q-quantile latency, or None while there are fewer than HEDGE_MIN_SAMPLES samples
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(provider) or [])
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+_latencies = LatencyTracker()
+
+
+def is_valid_itinerary(text: str) -> bool:
+    """
+    A response counts as an answer only if it holds a trip JSON with at least one day
+    """
+    trip = extract_json(text)
+    return isinstance(trip, dict) and isinstance(trip.get("daily_itinerary"), list) and len(trip["daily_itinerary"]) > 0
+
+
+class HedgedLLMService(BaseLLMService):
+    """
+    Meta-provider: runs the primary, and only if it has not answered within its p95
+    latency (or failed) starts the secondary. The first valid itinerary wins and
+    the other request is cancelled, so most requests still cost a single provider.
+    Single chat rounds (and fan-out sub-requests) are not hedged, they go to the primary.
+    """
+
+    def __init__(self, primary_name: str, primary: BaseLLMService, secondary_name: str, secondary: BaseLLMService):
+        self.primary = (primary_name, primary)
+        self.secondary = (secondary_name, secondary)
+
+    @property
+    def tools(self):
+        return self.primary[1].tools
+
+    def _record_loser(self, primary_finished: bool, start: float, winner: str):
+        # The primary lost the race: it took at least this long
+        if winner != self.primary[0] and not primary_finished:
+            _latencies.record(self.primary[0], time.monotonic() - start)
+
+    def hedge_delay(self) -> float:
+        p95 = _latencies.percentile(self.primary[0])
+        return p95 if p95 is not None else HEDGE_DEFAULT_DELAY_SECONDS
+
+    def generate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        delay = self.hedge_delay()
+        start = time.monotonic()
+        pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedge")
+        cancels = {}
+
+        def run(name, service, cancel):
+            begin = time.monotonic()
+            try:
+                text = service.generate_trip(user_prompt, enable_flights, cancel_event=cancel)
+            except Exception as e:
+                print(f"❌ [Hedge] {name} 失敗: {e}")
+                text = ""
+            return name, text, time.monotonic() - begin
+
+        def launch(name, service):
+            cancels[name] = threading.Event()
+            return telemetry.submit(pool, run, name, service, cancels[name])
+
+        pending = {launch(*self.primary)}
+        hedged = False
+        primary_finished = False
+        fallback = ""
+        try:
+            while pending:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                # Poll at least once a second so an outside cancel is noticed
+                timeout = 1.0 if hedged else min(1.0, max(0.0, start + delay - time.monotonic()))
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name, text, elapsed = future.result()
+                    _latencies.record(name, elapsed)
+                    primary_finished = primary_finished or name == self.primary[0]
+                    if is_valid_itinerary(text):
+                        self._record_loser(primary_finished, start, name)
+                        print(f"🏁 [Hedge] 採用 {name} ({elapsed:.1f}s)")
+                        telemetry.annotate(hedge_winner=name, hedged=hedged)
+                        return text
+                    fallback = fallback or text
+
+                # Hedge once: the primary is past its threshold, or it already failed
+                if not hedged and (done or time.monotonic() - start >= delay):
+                    hedged = True
+                    print(f"🪁 [Hedge] {self.primary[0]} 超過 {delay:.1f}s 或失敗，啟動 {self.secondary[0]}")
+                    pending.add(launch(*self.secondary))
+            return fallback
+        finally:
+            # Losers stop before their next round; a call already in flight is left to finish in the background
+            for cancel in cancels.values():
+                cancel.set()
+            pool.shutdown(wait=False)
+
+    async def agenerate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        delay = self.hedge_delay()
+        start = time.monotonic()
+
+        async def run(name, service):
+            begin = time.monotonic()
+            try:
+                text = await service.agenerate_trip(user_prompt, enable_flights, cancel_event=cancel_event)
+            except Exception as e:
+                print(f"❌ [Hedge] {name} 失敗: {e}")
+                text = ""
+            return name, text, time.monotonic() - begin
+
+        pending = {asyncio.ensure_future(run(*self.primary))}
+        hedged = False
+        primary_finished = False
+        fallback = ""
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=None if hedged else delay,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name, text, elapsed = task.result()
+                    _latencies.record(name, elapsed)
+                    primary_finished = primary_finished or name == self.primary[0]
+                    if is_valid_itinerary(text):
+                        self._record_loser(primary_finished, start, name)
+                        print(f"🏁 [Hedge] 採用 {name} ({elapsed:.1f}s)")
+                        telemetry.annotate(hedge_winner=name, hedged=hedged)
+                        return text
+                    fallback = fallback or text
+
+                if not hedged:
+                    hedged = True
+                    print(f"🪁 [Hedge] {self.primary[0]} 超過 {delay:.1f}s 或失敗，啟動 {self.secondary[0]}")
+                    pending.add(asyncio.ensure_future(run(*self.secondary)))
+            return fallback
+        finally:
+            # Async requests can really be cancelled, including the HTTP call in flight
+            for task in pending:
+                task.cancel()
+
+    def generate_trip_stream(self, user_prompt: str, enable_flights: bool = True, cancel_event=None):
+        # Racing two streams into one view would interleave them; hedge the whole plan instead
+        yield "done", self.generate_trip(user_prompt, enable_flights, cancel_event)
+
+    def complete(self, system_prompt, user_prompt, use_tools=True, cancel_event=None):
+        # Fan-out sub-requests are short; only whole plans are hedged
+        return self.primary[1].complete(system_prompt, user_prompt, use_tools, cancel_event)
+
+    # Single rounds use the primary (same message format as its tools / history hooks)
+    def _chat(self, messages, tools=None):
+        return self.primary[1]._chat(messages, tools)
+
+    async def _achat(self, messages, tools=None):
+        return await self.primary[1]._achat(messages, tools)
+
+    def _chat_stream(self, messages, tools=None):
+        return self.primary[1]._chat_stream(messages, tools)
+
+    def _append_assistant(self, messages, turn):
+        self.primary[1]._append_assistant(messages, turn)
+
+    def _append_tool_results(self, messages, results):
+        self.primary[1]._append_tool_results(messages, results)
+
+    def health_check(self):
+        return self.primary[1].health_check()
+
+    def close(self):
+        # The wrapped services belong to the pool
+        pass
+
+
+_pool = ServicePool()
+
+
+def get_service_pool() -> ServicePool:
+    return _pool
+
+
+def get_llm_service(provider: str, health_check: bool = True):
+    """
+    :param health_check: False skips the health check of an idle pooled service (see ServicePool.get)
+    """
+    if provider == HEDGED_PROVIDER:
+        return HedgedLLMService(
+            HEDGE_PRIMARY, get_llm_service(HEDGE_PRIMARY, health_check),
+            HEDGE_SECONDARY, get_llm_service(HEDGE_SECONDARY, health_check)
+        )
+
+    elif provider == "Google Gemini":
         api_key = st.secrets['GOOGLE_API_KEY'] or os.getenv("GOOGLE_API_KEY")
-        return GeminiService(api_key)
+        return _pool.get(ServicePool.make_key(provider, None, api_key), lambda: GeminiService(api_key),
+                         health_check=health_check)
         
     elif provider == "Groq (LPU)":
-        return GroqService()
+        api_key = st.secrets['GROQ_API_KEY'] or os.getenv("GROQ_API_KEY")
+        return _pool.get(ServicePool.make_key(provider, GROQ_BASE_URL, api_key),
+                         lambda: GroqService(api_key, base_url=GROQ_BASE_URL), health_check=health_check)
         
     elif provider == "Hugging Face (Open Source)":
-        return HuggingFaceService()
+        api_key = st.secrets['HF_TOKEN'] or os.getenv("HF_TOKEN")
+        return _pool.get(ServicePool.make_key(provider, HF_BASE_URL, api_key),
+                         lambda: HuggingFaceService(api_key, base_url=HF_BASE_URL), health_check=health_check)
 
     elif "Local Ollama" in provider:
         ollama_host =  st.secrets['OLLAMA_HOST'] or os.getenv("OLLAMA_HOST", "http://localhost:11434")
         model_name = "qwen2.5:14b" # 或 llama3.1
-        return OllamaService(model_name=model_name, host=ollama_host)
+        return _pool.get(
+            ServicePool.make_key(provider, model_name, ollama_host),
+            lambda: OllamaService(model_name=model_name, host=ollama_host),
+            health_check=health_check
+        )
 
     elif "Remote Ollama" in provider:
         host = st.secrets['REMOTE_OLLAMA_HOST'] or os.getenv("REMOTE_OLLAMA_HOST")
@@ -29,7 +357,44 @@ def get_llm_service(provider: str):
         if not host or not token:
             raise ValueError("請在 .env 設定 REMOTE_OLLAMA_HOST 和 REMOTE_OLLAMA_TOKEN")
             
-        return OllamaService(model_name=model, host=host, auth_token=token)
+        return _pool.get(
+            ServicePool.make_key(provider, model, host, token),
+            lambda: OllamaService(model_name=model, host=host, auth_token=token),
+            health_check=health_check
+        )
         
     else:
-        raise ValueError("未知的 LLM 提供者")
\ No newline at end of file
+        raise ValueError("未知的 LLM 提供者")
+
+
+# Providers whose service lookup is running on a warm-up thread
+_warming_providers = set()
+_warming_lock = threading.Lock()
+
+
+def warm_up_providers(selected: str):
+    """
+    Preload Ollama models (the selected one and OLLAMA_WARMUP_PROVIDER) in the background.
+    Never blocks the rerun: the service lookup (secrets, pool) happens on the warm-up thread as well.
+    Whether the model still has to be warmed up is decided by the service itself (warm_state),
+    so a failed warm-up or a model unloaded after OLLAMA_KEEP_ALIVE is retried on a later rerun.
+    """
+    for provider in {selected, OLLAMA_WARMUP_PROVIDER}:
+        if "Ollama" not in provider:
+            continue
+        with _warming_lock:
+            if provider in _warming_providers:
+                continue
+            _warming_providers.add(provider)
+        threading.Thread(target=_warm_up_provider, args=(provider,), name="llm-warmup", daemon=True).start()
+
+
+def _warm_up_provider(provider: str):
+    try:
+        get_llm_service(provider, health_check=False).warm_up()
+    except Exception as e:
+        # e.g. missing OLLAMA_HOST / REMOTE_OLLAMA_* secrets, reported again when the user submits
+        print(f"⚠️ [LLM] {provider} 預熱略過: {e}")
+    finally:
+        with _warming_lock:
+            _warming_providers.discard(provider)
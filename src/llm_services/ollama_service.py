@@ -1,9 +1,33 @@
-from ollama import Client
+from ollama import Client, AsyncClient
+import os
 import json
+import time
+import threading
 from .base_service import BaseLLMService
-from src.tools.tools import search_flights, search_activity_tickets, search_flight_average_cost, search_internet
-from src.tools.prompt import *
+from .agent_loop import ChatTurn, ToolCall
 from src.tools.tools_list import get_tool_lists
+from src.tools.prompt import get_system_prompt
+
+# How long the server keeps the model loaded after each request ("30m", "-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE") or "30m"
+
+
+def keep_alive_seconds(value: str):
+    """
+    Parse an Ollama keep_alive value ("30m", "1h", "90s", "300")
+    :return seconds, or None when the model stays loaded forever (negative value)
+    """
+    value = str(value).strip().lower()
+    units = {"h": 3600, "m": 60, "s": 1}
+    try:
+        if value and value[-1] in units:
+            seconds = float(value[:-1]) * units[value[-1]]
+        else:
+            seconds = float(value)
+    except ValueError:
+        return 5 * 60  # server default
+    return None if seconds < 0 else seconds
+
 
 class OllamaService(BaseLLMService):
     def __init__(self, model_name="llama3:8b", host="http://localhost:11434", auth_token=None):
@@ -21,61 +45,156 @@ class OllamaService(BaseLLMService):
             
         # The address of the ollama server
         self.client = Client(host=host, headers=headers)
+        self.async_client = AsyncClient(host=host, headers=headers)
         
         self.tools = get_tool_lists()
 
-    def generate_trip(self, user_prompt: str, enable_flights: bool = True) -> str:
-        system_prompt=get_system_prompt(enable_flights)
-
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt}
-        ]
+        self._warm_lock = threading.Lock()
+        self._warm_state = None  # None / "warming" / "ready"
+        self._last_request = None  # monotonic time of the last request, which renews keep_alive
 
-        print(f"🚀 [Remote Ollama] 連線至 {self.client._client.base_url} (Model: {self.model})...")
+    def warm_up(self):
+        """
+        Preload the model in the background (idempotent, safe to call on every rerun).
+        The warm-up request also evaluates the static system prompt + tools, so the
+        server's prompt cache already holds that prefix for the first real request.
+        Once OLLAMA_KEEP_ALIVE has passed without a request the server has unloaded
+        the model, so the next call warms it up again.
+        """
+        with self._warm_lock:
+            if self._warm_state == "ready" and self._unloaded():
+                self._warm_state = None
+            if self._warm_state is not None:
+                return
+            self._warm_state = "warming"
+        threading.Thread(target=self._warm_up, name="ollama-warmup", daemon=True).start()
 
+    def _warm_up(self):
+        start = time.monotonic()
         try:
-            response = self.client.chat(
+            self.client.chat(
                 model=self.model,
-                messages=messages,
+                messages=[{"role": "system", "content": get_system_prompt()}],
                 tools=self.tools,
-                options={"temperature": 0.1}
+                options={"temperature": 0.1, "num_predict": 1},
+                keep_alive=OLLAMA_KEEP_ALIVE
             )
+            state = "ready"
+            self._last_request = time.monotonic()
+            print(f"🔥 [Ollama] {self.model} 預熱完成 ({time.monotonic() - start:.1f}s，keep_alive={OLLAMA_KEEP_ALIVE})")
         except Exception as e:
-            return json.dumps({"trip_name": "連線錯誤", "daily_itinerary": [], "budget_analysis": f"無法連接遠端 Ollama: {e}"}, ensure_ascii=False)
-
-        tool_calls = response['message'].get('tool_calls')
-
-        if tool_calls:
-            messages.append(response['message'])
-
-            for tool in tool_calls:
-                fn_name = tool.function.name
-                fn_args = tool.function.arguments
-                print(f"🚀 [Remote Ollama] 呼叫工具: {fn_name}")
-
-                if fn_name == "search_flights":
-                    res = search_flights(**fn_args)
-                elif fn_name == "search_activity_tickets":
-                    res = search_activity_tickets(**fn_args)
-                elif fn_name == "search_flight_average_cost":
-                    res = search_flight_average_cost(**fn_args)
-                elif fn_name == "search_internet":
-                    res = search_internet(**fn_args)
-                else:
-                    res = {"error": "Unknown tool"}
-
-                messages.append({
-                    "role": "tool",
-                    "content": json.dumps(res, ensure_ascii=False)
-                })
-
-            final_response = self.client.chat(
-                model=self.model,
-                messages=messages,
-                format="json", 
-                options={"temperature": 0.1}
-            )
-            return final_response['message']['content']
-        
-        return response['message']['content']
\ No newline at end of file
+            # Try again on the next rerun
+            state = None
+            print(f"⚠️ [Ollama] 預熱失敗: {e}")
+        with self._warm_lock:
+            self._warm_state = state
+
+    @property
+    def warm_state(self):
+        return self._warm_state
+
+    def _unloaded(self) -> bool:
+        window = keep_alive_seconds(OLLAMA_KEEP_ALIVE)
+        return (window is not None and self._last_request is not None
+                and time.monotonic() - self._last_request > window)
+
+    def health_check(self):
+        # Cheap call that also re-opens the tunnel connection if it went stale
+        self.client.list()
+        return True
+
+    def close(self):
+        # ollama's clients only wrap an httpx client
+        self.client._client.close()
+        self._close_async_client()
+
+    async def _aclose(self):
+        await self.async_client._client.aclose()
+
+    def generate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        print(f"🚀 [Remote Ollama] 連線至 {self.client._client.base_url} (Model: {self.model})...")
+
+        try:
+            return super().generate_trip(user_prompt, enable_flights, cancel_event)
+        except Exception as e:
+            return self._error_json(e)
+
+    async def agenerate_trip(self, user_prompt: str, enable_flights: bool = True, cancel_event=None) -> str:
+        try:
+            return await super().agenerate_trip(user_prompt, enable_flights, cancel_event)
+        except Exception as e:
+            return self._error_json(e)
+
+    @staticmethod
+    def _error_json(e):
+        return json.dumps({"trip_name": "連線錯誤", "daily_itinerary": [], "budget_analysis": f"無法連接遠端 Ollama: {e}"}, ensure_ascii=False)
+
+    def _request(self, messages, tools=None, **extra):
+        kwargs = {"tools": tools} if tools else {"format": "json"}
+        self._last_request = time.monotonic()
+        return dict(
+            model=self.model,
+            messages=messages,
+            options={"temperature": 0.1},
+            # Keep the model resident between plans instead of the server default (5 minutes)
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            **kwargs,
+            **extra
+        )
+
+    def _chat(self, messages, tools=None):
+        return self._to_turn(self.client.chat(**self._request(messages, tools)))
+
+    async def _achat(self, messages, tools=None):
+        return self._to_turn(await self.async_client.chat(**self._request(messages, tools)))
+
+    @staticmethod
+    def _to_turn(response):
+        tool_calls = response['message'].get('tool_calls') or []
+        for tool in tool_calls:
+            print(f"🚀 [Remote Ollama] 呼叫工具: {tool.function.name}")
+
+        return ChatTurn(
+            content=response['message']['content'],
+            # Ollama has no tool_call_id, so the results must follow the call order
+            tool_calls=[
+                ToolCall(idx, tool.function.name, tool.function.arguments)
+                for idx, tool in enumerate(tool_calls)
+            ],
+            tokens=(response.get('prompt_eval_count') or 0) + (response.get('eval_count') or 0),
+            raw=response['message']
+        )
+
+    def _chat_stream(self, messages, tools=None):
+        text = ""
+        tool_calls = []
+        tokens = 0
+        for part in self.client.chat(**self._request(messages, tools, stream=True)):
+            delta = part['message']['content']
+            if delta:
+                text += delta
+                yield delta
+            # Ollama sends tool calls whole, not in pieces
+            tool_calls.extend(part['message'].get('tool_calls') or [])
+            if part.get('done'):
+                tokens = (part.get('prompt_eval_count') or 0) + (part.get('eval_count') or 0)
+
+        for tool in tool_calls:
+            print(f"🚀 [Remote Ollama] 呼叫工具: {tool.function.name}")
+
+        return ChatTurn(
+            content=text,
+            tool_calls=[
+                ToolCall(idx, tool.function.name, tool.function.arguments)
+                for idx, tool in enumerate(tool_calls)
+            ],
+            tokens=tokens,
+            raw={"role": "assistant", "content": text, "tool_calls": tool_calls}
+        )
+
+    def _append_tool_results(self, messages, results):
+        for _, fn_name, content in results:
+            messages.append({
+                "role": "tool",
+                "content": content
+            })
\ No newline at end of file
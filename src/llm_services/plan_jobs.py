@@ -0,0 +1,378 @@
+"""
+Background planning jobs.
+A plan runs on a worker pool instead of the Streamlit script thread, so widget
+interactions (reruns) neither wait for it nor throw it away. Jobs live in a
+process-wide registry; a session only keeps the job id and polls its progress.
+"""
+import os
+import copy
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.utils import telemetry, progress
+from src.utils.json_stream import IncrementalTripParser
+from src.utils.plan_cache import get_plan_cache, normalize_plan_params, PlanCache
+from src.tools.prompt import get_user_request_prompt
+from src.tools.geocoder import fill_missing_coordinates
+from src.llm_services.llm_factory import get_llm_service
+from src.llm_services.fanout import FANOUT_MIN_DAYS, iter_fanout_trip
+from src.llm_services.structured_output import finalize_trip
+
+PLAN_JOB_WORKERS = int(os.getenv("PLAN_JOB_WORKERS") or 4)
+# Finished jobs are kept this long (seconds) so a session can still pick up the result
+PLAN_JOB_TTL = float(os.getenv("PLAN_JOB_TTL") or 3600)
+# A session that has not polled its job for this long (closed tab, lost connection) stops following it
+PLAN_JOB_WATCHER_TIMEOUT = float(os.getenv("PLAN_JOB_WATCHER_TIMEOUT") or 60)
+MAX_FINISHED_JOBS = 100
+# Skeleton + finished days of cancelled fan-out jobs, kept (PLAN_JOB_TTL) for a resubmit of the same request
+MAX_PARTIAL_PLANS = 50
+MAX_LOG_LINES = 50
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+def job_key(inputs: dict) -> str:
+    """
+    Dedup key of a plan request: the normalized parameters with the exact (un-rounded) budget,
+    so a session only joins a job that plans exactly what it asked for
+    """
+    params = normalize_plan_params(inputs)
+    params["budget"] = int(inputs["budget"])
+    return PlanCache.make_keys(params)[0]
+
+
+class PlanJob:
+    def __init__(self, inputs: dict, key: str, watcher: str):
+        self.id = uuid.uuid4().hex
+        self.inputs = dict(inputs)
+        self.key = key
+        self.status = QUEUED
+        self.progress = "排隊中..."
+        self.log = []
+        self.days = []           # days finished so far (kept when the job is cancelled)
+        self.skeleton = None     # fan-out skeleton, reused with the finished days after a cancel
+        self.resume = None       # partial plan of a cancelled job with the same key (see iter_fanout_trip)
+        self.trip = None         # the trip when DONE, the finished days as a partial trip when CANCELLED
+        self.repairs = None
+        self.raw_response = ""
+        self.error = None
+        self.trace_id = None
+        self.cancel_event = threading.Event()
+        self.watchers = {watcher: time.time()}  # session id -> last poll; cancelled when none is left
+        self.created = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    def report(self, message: str):
+        with self._lock:
+            self.progress = message
+            self.log.append(message)
+            del self.log[:-MAX_LOG_LINES]
+        self.check_watchers()
+
+    def touch(self, watcher: str):
+        with self._lock:
+            self.watchers[watcher] = time.time()
+
+    def release(self, watcher: str) -> bool:
+        """
+        :return True if no session follows the job any more
+        """
+        with self._lock:
+            self.watchers.pop(watcher, None)
+            return not self.watchers
+
+    def check_watchers(self):
+        """
+        Drop sessions that stopped polling; cancel the job once nobody is left to see it
+        """
+        now = time.time()
+        with self._lock:
+            for watcher in [w for w, seen in self.watchers.items() if now - seen > PLAN_JOB_WATCHER_TIMEOUT]:
+                del self.watchers[watcher]
+            abandoned = not self.watchers and not self.cancel_event.is_set()
+        if abandoned and not self.finished:
+            print(f"👻 [Job] {self.id[:8]} 已無人追蹤，取消規劃")
+            self.cancel_event.set()
+
+    @property
+    def planned_days(self) -> int:
+        """
+        Days with attractions (a cancelled fan-out leaves empty placeholders)
+        """
+        return sum(1 for day in self.days if day.get("attractions"))
+
+    @property
+    def resumable(self) -> bool:
+        """
+        A resubmit of the same request reuses the finished days (fan-out only)
+        """
+        return self.skeleton is not None and self.planned_days > 0
+
+    def set_days(self, days: list):
+        with self._lock:
+            self.days = sorted(days, key=lambda d: d.get("day") or 0)
+
+    def start(self):
+        with self._lock:
+            self.status = RUNNING
+
+    def finish(self, status: str):
+        with self._lock:
+            self.status = status
+            self.finished_at = time.time()
+
+    def snapshot(self) -> dict:
+        """
+        Consistent copy for the UI (the worker keeps writing)
+        """
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "progress": self.progress,
+                "log": list(self.log),
+                "days": list(self.days),
+                "elapsed": (self.finished_at or time.time()) - self.created,
+                "cancelling": self.cancel_event.is_set() and not self.finished,
+            }
+
+
+_partials = OrderedDict()  # job key -> (saved_at, {"skeleton": dict, "days": [day]})
+_partials_lock = threading.Lock()
+
+
+def _save_partial(key: str, partial: dict):
+    with _partials_lock:
+        _partials.pop(key, None)
+        _partials[key] = (time.time(), partial)
+        while len(_partials) > MAX_PARTIAL_PLANS:
+            _partials.popitem(last=False)
+
+
+def _take_partial(key: str):
+    """
+    :return the partial plan saved for this key (removed from the store), or None
+    """
+    with _partials_lock:
+        saved_at, partial = _partials.pop(key, (0, None))
+    return partial if time.time() - saved_at <= PLAN_JOB_TTL else None
+
+
+def _keep_partial(job: PlanJob):
+    """
+    Cancelled: the finished days become a partial trip for the UI, and (fan-out) are saved
+    so that resubmitting the same request only plans the remaining days
+    """
+    kept = [copy.deepcopy(day) for day in job.days if day.get("attractions")]
+    if job.skeleton is not None and kept:
+        _save_partial(job.key, {"skeleton": job.skeleton, "days": kept})
+    elif job.resume:
+        # Cancelled before planning anything new: keep what the previous run had
+        _save_partial(job.key, job.resume)
+    if kept:
+        trip = {k: v for k, v in copy.deepcopy(job.skeleton or {}).items() if k != "daily_itinerary"}
+        trip["daily_itinerary"] = copy.deepcopy(kept)
+        fill_missing_coordinates(trip, job.inputs["destination"])
+        job.trip = trip
+
+
+def _consume(job: PlanJob, events) -> str:
+    """
+    Record the progress / partial days of a generate_trip_stream or iter_fanout_trip run
+    :return the final model output
+    """
+    parser = IncrementalTripParser()
+    fanout_days = []
+    final_text = ""
+    for event, data in events:
+        if event == "tool_round":
+            # The text streamed so far belonged to a tool calling round, not to the plan
+            job.report(f"🔎 查詢資料中：{', '.join(data)}")
+            parser.reset()
+        elif event == "status":
+            job.report(data)
+        elif event == "skeleton":
+            job.skeleton = data
+        elif event == "delta":
+            if parser.feed(data):
+                job.set_days(parser.days)
+                job.report(f"📝 已完成 {len(parser.days)} 天")
+        elif event == "day":
+            fanout_days.append(data)
+            job.set_days(fanout_days)
+            job.report(f"📅 已完成 {len(fanout_days)}/{job.inputs['days']} 天")
+        elif event == "done":
+            final_text = data
+    return final_text
+
+
+def _run(job: PlanJob):
+    inputs = job.inputs
+    job.check_watchers()
+    if job.cancel_event.is_set():
+        _keep_partial(job)
+        job.finish(CANCELLED)
+        return
+
+    job.start()
+    job.report("🚀 開始規劃...")
+    try:
+        with progress.listen(job.report), telemetry.trace(
+            "plan", provider=inputs["llm_provider"], days=inputs["days"], fan_out=inputs["days"] >= FANOUT_MIN_DAYS,
+            **telemetry.user_input(destination=inputs["destination"])
+        ) as root:
+            job.trace_id = root.trace_id
+            llm_service = get_llm_service(inputs["llm_provider"])
+            trip_args = (
+                inputs["destination"],
+                inputs["days"],
+                inputs["origin"],
+                inputs["start_date"],
+                inputs["budget"],
+                inputs["interests"]
+            )
+            enable_flights = inputs["enable_flight_search"]
+            # Long trips: skeleton first, then every day in parallel (one completion would hit max_tokens)
+            if inputs["days"] >= FANOUT_MIN_DAYS:
+                events = iter_fanout_trip(llm_service, *trip_args, enable_flights=enable_flights,
+                                          cancel_event=job.cancel_event, resume=job.resume)
+                job.raw_response = _consume(job, events)
+            elif inputs["enable_streaming"]:
+                events = llm_service.generate_trip_stream(get_user_request_prompt(*trip_args), enable_flights=enable_flights,
+                                                          cancel_event=job.cancel_event)
+                job.raw_response = _consume(job, events)
+            else:
+                job.raw_response = llm_service.generate_trip(get_user_request_prompt(*trip_args), enable_flights=enable_flights,
+                                                             cancel_event=job.cancel_event)
+
+            if job.cancel_event.is_set():
+                print(f"🛑 [Job] {job.id[:8]} 已取消，保留已完成的 {job.planned_days} 天")
+                _keep_partial(job)
+                job.finish(CANCELLED)
+                return
+
+            job.report("🩹 驗證行程格式...")
+            trip, job.repairs = finalize_trip(
+                llm_service, job.raw_response, inputs["destination"], inputs["days"], inputs["interests"]
+            )
+            # Fix missing / hallucinated coordinates with the offline gazetteer
+            fill_missing_coordinates(trip, inputs["destination"])
+            job.trip = trip
+            if trip.get("daily_itinerary"):
+                get_plan_cache().set(inputs, trip)
+        job.report("✅ 行程規劃完成！")
+        job.finish(DONE)
+    except Exception as e:
+        print(f"❌ [Job] {job.id[:8]} 失敗: {e}")
+        job.error = str(e)
+        job.finish(FAILED)
+
+
+class PlanJobRunner:
+    """
+    Worker pool + job registry shared by every session.
+    Submitting the same (normalized) request while it is still running returns the
+    running job instead of planning twice (from the same or another session).
+    Sessions following a job must poll it with touch(); one that stops polling for
+    PLAN_JOB_WATCHER_TIMEOUT seconds (e.g. the browser tab was closed) is dropped.
+    """
+
+    def __init__(self, max_workers: int = PLAN_JOB_WORKERS, ttl: float = PLAN_JOB_TTL):
+        self.ttl = ttl
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="plan-job")
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()  # job id -> PlanJob, oldest first
+
+    def submit(self, inputs: dict, watcher: str, previous: str = None) -> str:
+        """
+        :param watcher: id of the session following the job
+        :param previous: the job this session followed until now; it is released if it is another job
+        :return the job id
+        """
+        key = job_key(inputs)
+        with self._lock:
+            self._evict()
+            job = next((j for j in self._jobs.values()
+                        if j.key == key and not j.finished and not j.cancel_event.is_set()), None)
+            if job is not None:
+                print(f"🔗 [Job] 相同的規劃已在進行中，沿用 {job.id[:8]}")
+                job.touch(watcher)
+            else:
+                job = PlanJob(inputs, key, watcher)
+                job.resume = _take_partial(key)
+                if job.resume:
+                    print(f"♻️ [Job] 沿用先前取消時完成的 {len(job.resume['days'])} 天")
+                self._jobs[job.id] = job
+                # Outside any trace / progress listener of the caller
+                self._pool.submit(_run, job)
+                print(f"📨 [Job] 已排入規劃 {job.id[:8]}: {inputs['destination']} {inputs['days']} 天")
+
+        if previous and previous != job.id:
+            self.cancel(previous, watcher)
+        return job.id
+
+    def get(self, job_id: str):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def touch(self, job_id: str, watcher: str):
+        """
+        Record that the session is still polling the job
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.touch(watcher)
+
+    def cancel(self, job_id: str, watcher: str) -> bool:
+        """
+        Stop following a job. Once no session follows it, it stops before its next LLM round;
+        finished days and cached searches are kept.
+        :return True if the job itself is being cancelled, False if other sessions still wait for it
+                or the job has already finished (check job.finished to tell them apart)
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            if not job.release(watcher):
+                return False
+        job.cancel_event.set()
+        job.report("🛑 取消中...")
+        return True
+
+    def _evict(self):
+        now = time.time()
+        finished = [job for job in self._jobs.values() if job.finished]
+        for job in finished:
+            if now - job.finished_at > self.ttl:
+                del self._jobs[job.id]
+        overflow = [job for job in self._jobs.values() if job.finished][:-MAX_FINISHED_JOBS]
+        for job in overflow:
+            del self._jobs[job.id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner() -> PlanJobRunner:
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = PlanJobRunner()
+    return _runner
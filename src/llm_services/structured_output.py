@@ -0,0 +1,204 @@
+"""
+Validation layer for the trip JSON, shared by every provider.
+The model output is parsed (without a greedy regex), checked against TRIP_SCHEMA,
+and only the broken top-level fields or days are repaired with small follow-up
+requests, so a slightly broken plan never costs a second full LLM run.
+"""
+import re
+import json
+from concurrent.futures import ThreadPoolExecutor
+from jsonschema import Draft7Validator
+from src.tools.prompt import get_repair_system_prompt, get_repair_request_prompt
+from src.utils.json_stream import IncrementalTripParser
+from src.utils import telemetry
+
+ATTRACTION_SCHEMA = {
+    "type": "object",
+    "required": ["name"],
+    "properties": {
+        "name": {"type": "string", "minLength": 1},
+        "time": {"type": ["string", "null"]},
+        "description": {"type": "string"},
+        # Missing coordinates are filled by the gazetteer, so null is fine
+        "latitude": {"type": ["number", "null"]},
+        "longitude": {"type": ["number", "null"]},
+    },
+}
+
+DAY_SCHEMA = {
+    "type": "object",
+    "required": ["day", "attractions"],
+    "properties": {
+        "day": {"type": "integer", "minimum": 1},
+        "theme": {"type": "string"},
+        "attractions": {"type": "array", "minItems": 1, "items": ATTRACTION_SCHEMA},
+    },
+}
+
+TRIP_SCHEMA = {
+    "type": "object",
+    "required": ["trip_name", "daily_itinerary"],
+    "properties": {
+        "trip_name": {"type": "string", "minLength": 1},
+        "flight": {
+            "type": ["object", "null"],
+            "properties": {
+                "airline": {"type": ["string", "null"]},
+                "price": {"type": ["string", "number", "null"]},
+                "link": {"type": ["string", "null"]},
+            },
+        },
+        "budget_analysis": {"type": "string"},
+        "total_budget": {"type": ["integer", "number", "string"]},
+        "activities": {"type": "array", "items": {"type": "object"}},
+        "daily_itinerary": {"type": "array", "minItems": 1, "items": DAY_SCHEMA},
+    },
+}
+
+_trip_validator = Draft7Validator(TRIP_SCHEMA)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def extract_json(text: str):
+    """
+    First JSON object in the text; ignores ```json fences, preambles and trailing chatter
+    :return dict or None
+    """
+    start = (text or "").find("{")
+    if start < 0:
+        return None
+    decoder = json.JSONDecoder()
+    for candidate in (text[start:], _TRAILING_COMMA.sub(r"\1", text[start:])):
+        try:
+            data, _ = decoder.raw_decode(candidate)
+        except json.JSONDecodeError:
+            continue
+        return data if isinstance(data, dict) else None
+    return None
+
+
+def parse_trip(text: str):
+    """
+    :return the trip dict, or None when nothing usable is in the text.
+    A truncated answer (e.g. cut by max_tokens) still yields the days that were completed.
+    """
+    trip = extract_json(text)
+    if trip is not None:
+        return trip
+
+    parser = IncrementalTripParser()
+    days = parser.feed(text or "")
+    if days:
+        print(f"🩹 [Schema] JSON 不完整，保留已完成的 {len(days)} 天")
+        return {"daily_itinerary": days}
+    return None
+
+
+def validate_trip(trip: dict):
+    """
+    :return (broken top-level field names, indexes of broken days)
+    """
+    fields, days = set(), set()
+    for error in _trip_validator.iter_errors(trip):
+        path = list(error.absolute_path)
+        if not path:
+            if error.validator == "required":
+                fields.update(name for name in error.validator_value if name not in trip)
+            else:
+                fields.add("*")
+        elif path[0] == "daily_itinerary" and len(path) > 1:
+            days.add(path[1])
+        else:
+            fields.add(path[0])
+    return fields, days
+
+
+def _repair_days(service, trip: dict, broken: set, destination, days, interests) -> list:
+    """
+    Leave exactly days 1..days in the trip: drops extra, duplicate and broken days and re-plans the missing ones
+    :return the re-planned day numbers
+    :raises ValueError when no valid day is left (e.g. a provider error JSON), there is nothing to repair from
+    """
+    # Imported here: fanout imports this module at load time
+    from src.llm_services.fanout import build_outline, plan_day
+
+    itinerary = trip.get("daily_itinerary") if isinstance(trip.get("daily_itinerary"), list) else []
+    kept = {}
+    for idx, day in enumerate(itinerary):
+        if idx not in broken and isinstance(day, dict) and 1 <= day["day"] <= days:
+            kept.setdefault(day["day"], day)
+
+    if not kept:
+        # Nothing valid to build on: not a targeted repair any more
+        raise ValueError("行程中沒有任何可用的天數")
+
+    missing = [n for n in range(1, days + 1) if n not in kept]
+    if not missing:
+        trip["daily_itinerary"] = sorted(kept.values(), key=lambda d: d["day"])
+        return []
+
+    print(f"🩹 [Schema] 重新規劃第 {missing} 天")
+    outline = build_outline(trip, days)
+    with ThreadPoolExecutor(max_workers=min(4, len(missing)), thread_name_prefix="repair") as pool:
+        futures = [telemetry.submit(pool, plan_day, service, destination, interests, outline[n - 1], outline)
+                   for n in missing]
+        repaired = [future.result() for future in futures]
+
+    trip["daily_itinerary"] = sorted(list(kept.values()) + repaired, key=lambda d: d["day"])
+    return missing
+
+
+def _repair_fields(service, trip: dict, fields: set, destination, days) -> list:
+    fields = sorted(name for name in fields if name not in ("*", "daily_itinerary"))
+    if not fields:
+        return []
+
+    for name in fields:
+        trip.pop(name, None)
+    # Small context: everything except the day details
+    context = {k: v for k, v in trip.items() if k != "daily_itinerary"}
+    context["days"] = [{"day": d.get("day"), "theme": d.get("theme")} for d in trip.get("daily_itinerary", [])]
+
+    print(f"🩹 [Schema] 修復欄位: {', '.join(fields)}")
+    try:
+        fixed = extract_json(service.complete(
+            get_repair_system_prompt(),
+            get_repair_request_prompt(destination, days, fields, json.dumps(context, ensure_ascii=False)),
+            use_tools=False
+        )) or {}
+    except Exception as e:
+        print(f"⚠️ [Schema] 欄位修復失敗: {e}")
+        fixed = {}
+
+    repaired = []
+    for name in fields:
+        subschema = TRIP_SCHEMA["properties"].get(name)
+        if name in fixed and subschema and Draft7Validator(subschema).is_valid(fixed[name]):
+            trip[name] = fixed[name]
+            repaired.append(name)
+    # The only required field besides the days has an obvious default
+    if "trip_name" not in trip:
+        trip["trip_name"] = f"{destination} {days} 天行程"
+    return repaired
+
+
+def finalize_trip(service, text: str, destination, days, interests):
+    """
+    Parse, validate and repair the model output
+    :return (trip, report) with report = {"days": repaired day numbers, "fields": repaired field names}
+    :raises ValueError when the output holds no JSON at all or not a single valid day
+    """
+    with telemetry.span("finalize_trip", kind="parse") as span:
+        trip = parse_trip(text)
+        if trip is None:
+            raise ValueError("找不到 JSON")
+
+        fields, broken_days = validate_trip(trip)
+        if "*" in fields:
+            raise ValueError("JSON 不是物件")
+
+        report = {"days": _repair_days(service, trip, broken_days, destination, days, interests), "fields": []}
+        if fields - {"daily_itinerary"}:
+            report["fields"] = _repair_fields(service, trip, fields, destination, days)
+        span.set(repaired_days=report["days"], repaired_fields=report["fields"])
+        return trip, report
@@ -0,0 +1,189 @@
+"""
+Compaction of tool results before they are sent back to the LLM.
+Removes near-duplicate snippets and boilerplate, then truncates each result
+and the whole tool turn to a token budget. Structured results (tickets, geocodes)
+count toward the turn budget too and are trimmed when it is exceeded.
+"""
+import os
+import re
+import json
+
+TOOL_RESULT_TOKEN_BUDGET = int(os.getenv("TOOL_RESULT_TOKEN_BUDGET") or 600)
+TOOL_TURN_TOKEN_BUDGET = int(os.getenv("TOOL_TURN_TOKEN_BUDGET") or 3000)
+# Snippets sharing this much of their character 3-grams count as duplicates
+DUPLICATE_SIMILARITY = 0.8
+# Minimum tokens each free-text result keeps when the turn is over budget
+MIN_TEXT_TOKENS = 50
+# Display-only fields of structured results (the UI resolves them itself), dropped first
+DROPPABLE_FIELDS = {"image", "link_google"}
+# Text fields of structured results are shortened to this many characters (links are never cut)
+MAX_FIELD_CHARS = 80
+
+_CJK = re.compile(r"[぀-ヿ㐀-鿿가-힯＀-￯]")
+_BOILERPLATE = [
+    re.compile(r"(?:[A-Z][a-z]{2} \d{1,2}, \d{4}|\d{4}年\d{1,2}月\d{1,2}日)\s*[·—\-]\s*"),  # "Mar 5, 2024 · "
+    re.compile(r"(?:閱讀更多|繼續閱讀|查看更多|Read more|See more)\s*[»>]*", re.IGNORECASE),
+    re.compile(r"(?:\.\.\.|…)+\s*$"),
+    re.compile(r"(?<=[?&])(?:utm_[a-z]+|fbclid|gclid)=[^&)\s]*&?"),
+]
+_SPACES = re.compile(r"\s{2,}")
+_TRUNCATED = " …(已截斷)"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count without a tokenizer: ~1 token per CJK character, ~4 characters per token otherwise
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _strip_boilerplate(line: str) -> str:
+    for pattern in _BOILERPLATE:
+        line = pattern.sub("", line)
+    return _SPACES.sub(" ", line).strip()
+
+
+def _shingles(text: str) -> set:
+    text = re.sub(r"\W+", "", text.lower())
+    return {text[i:i + 3] for i in range(max(1, len(text) - 2))}
+
+
+def _dedupe_lines(lines: list) -> list:
+    kept, kept_shingles = [], []
+    for line in lines:
+        shingles = _shingles(line)
+        duplicate = any(
+            len(shingles & other) / max(1, len(shingles | other)) >= DUPLICATE_SIMILARITY
+            for other in kept_shingles
+        )
+        if not duplicate:
+            kept.append(line)
+            kept_shingles.append(shingles)
+    return kept
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    if estimate_tokens(text) <= budget:
+        return text
+
+    # Keep whole lines while they fit, then cut the line that overflows
+    out, used = [], 0
+    for line in text.split("\n"):
+        cost = estimate_tokens(line) + 1
+        if used + cost <= budget:
+            out.append(line)
+            used += cost
+            continue
+        remaining = budget - used
+        if remaining > 8:
+            cut = line
+            while cut and estimate_tokens(cut) > remaining:
+                cut = cut[:int(len(cut) * 0.9)]
+            out.append(cut)
+        break
+    return "\n".join(out).rstrip() + _TRUNCATED
+
+
+def compact_text(text: str) -> str:
+    """
+    Strip boilerplate and drop near-duplicate lines (search snippets are one per line)
+    """
+    lines = [_strip_boilerplate(line) for line in text.split("\n")]
+    return "\n".join(_dedupe_lines([line for line in lines if line]))
+
+
+def _json_tokens(value) -> int:
+    return estimate_tokens(json.dumps(value, ensure_ascii=False))
+
+
+def _slim(value):
+    """
+    Copy without display-only fields, with long text fields shortened (URLs kept whole)
+    """
+    if isinstance(value, dict):
+        return {k: _slim(v) for k, v in value.items() if k not in DROPPABLE_FIELDS}
+    if isinstance(value, list):
+        return [_slim(v) for v in value]
+    if isinstance(value, str) and len(value) > MAX_FIELD_CHARS and not value.startswith("http"):
+        return value[:MAX_FIELD_CHARS] + "…"
+    return value
+
+
+def trim_structured(value, budget: int):
+    """
+    Shrink a dict / list tool result to about `budget` tokens: drop display-only fields,
+    shorten text fields, then drop trailing list items (at least one item is kept).
+    :return the trimmed value (the original one if it already fits)
+    """
+    if _json_tokens(value) <= budget:
+        return value
+    value = _slim(value)
+    if _json_tokens(value) <= budget:
+        return value
+
+    # Item lists: the top-level list, or the list fields of a dict (e.g. ticket_batch["tickets"])
+    if isinstance(value, list):
+        holders = [(None, value)]
+    elif isinstance(value, dict):
+        holders = sorted(((k, v) for k, v in value.items() if isinstance(v, list)), key=lambda kv: -len(kv[1]))
+    else:
+        holders = []
+
+    omitted = 0
+    for _, items in holders:
+        while len(items) > 1 and _json_tokens(value) > budget:
+            items.pop()
+            omitted += 1
+    if omitted and isinstance(value, dict):
+        value["omitted"] = omitted
+    return value
+
+
+def compact_tool_results(results: list, result_budget: int = TOOL_RESULT_TOKEN_BUDGET,
+                         turn_budget: int = TOOL_TURN_TOKEN_BUDGET):
+    """
+    :param results: list of (tool_call_id, fn_name, result) from execute_tool_calls
+    :return (list of (tool_call_id, fn_name, content_str), stats)
+    Free-text search summaries are compacted and truncated. Structured (dict / list)
+    results keep their links; they are only trimmed (trim_structured) when together
+    they leave the text results less than MIN_TEXT_TOKENS each.
+    """
+    raw = [json.dumps(res, ensure_ascii=False) for _, _, res in results]
+    before = sum(estimate_tokens(content) for content in raw)
+
+    texts = {i: compact_text(res) for i, (_, _, res) in enumerate(results) if isinstance(res, str)}
+    structured = {i: estimate_tokens(raw[i]) for i in range(len(results)) if i not in texts}
+
+    # Structured results get what the text results' minimum leaves of the turn budget:
+    # smallest first, each at most an equal share of what is left
+    available = max(0, turn_budget - MIN_TEXT_TOKENS * len(texts))
+    trimmed = {}
+    if sum(structured.values()) > available:
+        pending = sorted(structured, key=structured.get)
+        for n, i in enumerate(pending):
+            share = available // (len(pending) - n)
+            if structured[i] > share:
+                trimmed[i] = json.dumps(trim_structured(results[i][2], share), ensure_ascii=False)
+            cost = estimate_tokens(trimmed.get(i, raw[i]))
+            available = max(0, available - cost)
+            structured[i] = cost
+
+    # Text results share whatever the structured results leave of the turn budget
+    if texts:
+        share = max(MIN_TEXT_TOKENS, (turn_budget - sum(structured.values())) // len(texts))
+        budget = min(result_budget, share)
+        texts = {i: truncate_to_tokens(text, budget) for i, text in texts.items()}
+
+    compacted = []
+    for i, (call_id, fn_name, _) in enumerate(results):
+        content = json.dumps(texts[i], ensure_ascii=False) if i in texts else trimmed.get(i, raw[i])
+        compacted.append((call_id, fn_name, content))
+
+    after = sum(estimate_tokens(content) for _, _, content in compacted)
+    stats = {"tokens_before": before, "tokens_after": after, "tokens_saved": before - after}
+    if results:
+        print(f"🗜️ [Compact] 工具結果 {before} → {after} tokens (節省 {before - after})")
+    return compacted, stats
@@ -0,0 +1,96 @@
+"""
+Thread-safe pool of DDGS clients shared by all tools.
+A DDGS instance keeps its HTTP sessions alive between searches, so reusing it
+skips the session setup / TLS handshake that a fresh DDGS() pays every time.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from ddgs import DDGS
+
+DDGS_POOL_SIZE = int(os.getenv("DDGS_POOL_SIZE") or 4)
+# Idle clients older than this are recreated, the server closes keep-alive connections anyway
+DDGS_MAX_IDLE_SECONDS = float(os.getenv("DDGS_MAX_IDLE_SECONDS") or 120)
+
+# Errors that do not mean the session itself is broken
+_HEALTHY_ERRORS = ("Ratelimit", "No results")
+
+
+class DDGSPool:
+    def __init__(self, size: int = DDGS_POOL_SIZE, max_idle: float = DDGS_MAX_IDLE_SECONDS):
+        self.size = size
+        self.max_idle = max_idle
+        self._idle = []  # [(client, last_used)]
+        self._created = 0
+        self._cond = threading.Condition()
+        self.stats = {"created": 0, "reused": 0, "discarded": 0}
+
+    def _checkout(self):
+        with self._cond:
+            while True:
+                while self._idle:
+                    client, last_used = self._idle.pop()
+                    if time.monotonic() - last_used <= self.max_idle:
+                        self.stats["reused"] += 1
+                        return client
+                    # Stale keep-alive connection, drop it
+                    self._created -= 1
+                    self.stats["discarded"] += 1
+
+                if self._created < self.size:
+                    self._created += 1
+                    break
+                self._cond.wait()
+
+        try:
+            client = DDGS()
+        except Exception:
+            with self._cond:
+                self._created -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.stats["created"] += 1
+        return client
+
+    def _checkin(self, client, broken: bool):
+        with self._cond:
+            if broken:
+                self._created -= 1
+                self.stats["discarded"] += 1
+            else:
+                self._idle.append((client, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def client(self):
+        """
+        Borrow a client exclusively. A client that raised a session/connection error
+        is discarded and a fresh one is created on the next checkout.
+        """
+        client = self._checkout()
+        broken = False
+        try:
+            yield client
+        except Exception as e:
+            broken = not any(marker in str(e) for marker in _HEALTHY_ERRORS)
+            if broken:
+                print(f"♻️ [DDGS Pool] Session 異常，重建連線: {e}")
+            raise
+        finally:
+            self._checkin(client, broken)
+
+
+_pool = DDGSPool()
+
+
+def ddgs_client():
+    """
+    `with ddgs_client() as ddgs:` borrow a pooled DDGS client
+    """
+    return _pool.client()
+
+
+def get_ddgs_pool() -> DDGSPool:
+    return _pool
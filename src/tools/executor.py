@@ -0,0 +1,185 @@
+"""
+Shared tool executor for the tool calling loops.
+Runs independent tool calls concurrently and returns the results in call order.
+"""
+import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from src.utils import telemetry, progress
+from src.tools.tools import (
+    search_flights,
+    search_activity_tickets,
+    search_activity_tickets_batch,
+    search_flight_average_cost,
+    search_internet,
+    search_internet_average_cost,
+    geocode_place,
+)
+
+# Name -> function, used by every provider instead of its own if/elif chain
+TOOL_FUNCTIONS = {
+    "search_flights": search_flights,
+    "search_activity_tickets": search_activity_tickets,
+    "search_activity_tickets_batch": search_activity_tickets_batch,
+    "search_flight_average_cost": search_flight_average_cost,
+    "search_internet": search_internet,
+    "search_internet_average_cost": search_internet_average_cost,
+    "geocode_place": geocode_place,
+}
+
+# Seconds one call may take before we give up on it (counted from when a worker starts it)
+TOOL_TIMEOUTS = {
+    "search_flights": 5,
+    "search_activity_tickets": 30,
+    "search_activity_tickets_batch": 60,
+    "search_flight_average_cost": 25,
+    "search_internet": 20,
+    "search_internet_average_cost": 20,
+    "geocode_place": 2,
+}
+DEFAULT_TOOL_TIMEOUT = 20
+
+MAX_TOOL_WORKERS = int(os.getenv("MAX_TOOL_WORKERS") or 6)
+# A call still waiting for a free worker after this long is given up (the pool is saturated)
+MAX_TOOL_QUEUE_SECONDS = float(os.getenv("MAX_TOOL_QUEUE_SECONDS") or 60)
+# How often a waiting caller checks whether its queued call has started
+QUEUE_POLL_SECONDS = 0.2
+
+# Bounded pool shared by all sessions; a timed out search keeps its worker
+# until it returns, but never blocks the caller
+_pool = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="tool")
+
+
+def run_tool(fn_name: str, fn_args):
+    """
+    Run one tool by name. Arguments may be a JSON string (Groq/HF) or a dict (Ollama).
+    """
+    fn = TOOL_FUNCTIONS.get(fn_name)
+    if fn is None:
+        return {"error": "Unknown tool"}
+
+    with telemetry.span(f"tool.{fn_name}", kind="tool") as span:
+        try:
+            if isinstance(fn_args, str):
+                fn_args = json.loads(fn_args) if fn_args.strip() else {}
+            span.set(**telemetry.user_input(arguments=fn_args))
+            return fn(**(fn_args or {}))
+        except Exception as e:
+            print(f"❌ [Tool] {fn_name} 執行失敗: {e}")
+            span.set(failed=str(e))
+            return {"error": f"{fn_name} failed: {e}"}
+
+
+def _counted(step):
+    """
+    run_tool that reports "工具 n/total" when it finishes
+    """
+    def run(fn_name, fn_args):
+        result = run_tool(fn_name, fn_args)
+        step(fn_name)
+        return result
+    return run
+
+
+def _marks_start(run, started: list):
+    """
+    run that appends its start time to `started` when a worker picks it up
+    """
+    def wrapper(fn_name, fn_args):
+        started.append(time.monotonic())
+        return run(fn_name, fn_args)
+    return wrapper
+
+
+def _next_wait(started: list, submitted: float, timeout: float):
+    """
+    The tool timeout only runs once the call has started, so calls queued behind a
+    busy pool are not timed out before they ever run.
+    :return seconds to wait next, or None once the call has timed out (or waited too long for a worker)
+    """
+    now = time.monotonic()
+    if started:
+        left = started[0] + timeout - now
+        return left if left > 0 else None
+    left = submitted + MAX_TOOL_QUEUE_SECONDS - now
+    return min(left, QUEUE_POLL_SECONDS) if left > 0 else None
+
+
+def _result(future, started: list, submitted: float, timeout: float):
+    """
+    future.result() with the tool timeout counted from the start of the call
+    :raise FutureTimeoutError
+    """
+    while True:
+        wait = _next_wait(started, submitted, timeout)
+        if wait is None and not future.done():
+            # Drops the call if it is still queued; a running call finishes in the background
+            future.cancel()
+            raise FutureTimeoutError()
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            pass
+
+
+def execute_tool_calls(tool_calls: list) -> list:
+    """
+    Execute tool calls concurrently.
+    :param tool_calls: list of (tool_call_id, fn_name, fn_args)
+    :return list of (tool_call_id, fn_name, result), in the same order as tool_calls
+    """
+    start = time.monotonic()
+    run = _counted(progress.counter("🔧 工具", len(tool_calls)))
+    futures = []
+    for call_id, fn_name, fn_args in tool_calls:
+        started = []
+        futures.append((call_id, fn_name, started, telemetry.submit(_pool, _marks_start(run, started), fn_name, fn_args)))
+
+    results = []
+    for call_id, fn_name, started, future in futures:
+        try:
+            res = _result(future, started, start, TOOL_TIMEOUTS.get(fn_name, DEFAULT_TOOL_TIMEOUT))
+        except FutureTimeoutError:
+            print(f"⏱️ [Tool] {fn_name} 逾時，略過此結果")
+            telemetry.count("tool_timeouts")
+            res = {"error": f"{fn_name} timed out"}
+        results.append((call_id, fn_name, res))
+
+    print(f"🧰 [Tool] {len(tool_calls)} 個工具呼叫完成，耗時 {time.monotonic() - start:.1f}s")
+    return results
+
+
+async def aexecute_tool_calls(tool_calls: list) -> list:
+    """
+    Async version of execute_tool_calls: the (blocking) tools still run on the shared
+    pool, but the caller awaits them concurrently instead of holding a thread.
+    :param tool_calls: list of (tool_call_id, fn_name, fn_args)
+    :return list of (tool_call_id, fn_name, result), in the same order as tool_calls
+    """
+    loop = asyncio.get_running_loop()
+    start = time.monotonic()
+    run = _counted(progress.counter("🔧 工具", len(tool_calls)))
+
+    async def run_one(fn_name, fn_args):
+        started = []
+        future = loop.run_in_executor(_pool, telemetry.bind(_marks_start(run, started)), fn_name, fn_args)
+        timeout = TOOL_TIMEOUTS.get(fn_name, DEFAULT_TOOL_TIMEOUT)
+        while True:
+            wait = _next_wait(started, start, timeout)
+            if wait is None and not future.done():
+                future.cancel()
+                print(f"⏱️ [Tool] {fn_name} 逾時，略過此結果")
+                telemetry.count("tool_timeouts")
+                return {"error": f"{fn_name} timed out"}
+            try:
+                return await asyncio.wait_for(asyncio.shield(future), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+
+    outputs = await asyncio.gather(*(run_one(fn_name, fn_args) for _, fn_name, fn_args in tool_calls))
+    results = [(call_id, fn_name, res) for (call_id, fn_name, _), res in zip(tool_calls, outputs)]
+
+    print(f"🧰 [Tool] {len(tool_calls)} 個工具呼叫完成，耗時 {time.monotonic() - start:.1f}s")
+    return results
@@ -0,0 +1,210 @@
+"""
+Offline geocoding with a local gazetteer (data/gazetteer.tsv).
+Name index + grid spatial index, loaded once per process, no network call.
+"""
+import os
+import re
+import math
+import threading
+import unicodedata
+
+GAZETTEER_PATH = os.getenv("GAZETTEER_PATH") or "data/gazetteer.tsv"
+
+# Grid cell size of the spatial index (degrees, ~55 km)
+GRID_CELL_DEG = 0.5
+# Attractions farther than this from the destination are treated as hallucinated
+MAX_DISTANCE_KM = 150
+# A gazetteer hit overrides model coordinates that are off by more than this
+MAX_DRIFT_KM = 3
+# A partial name match must cover this share of the longer name
+# (「巴黎迪士尼樂園」 must not resolve to 「迪士尼樂園」 in Tokyo)
+MIN_MATCH_RATIO = 0.75
+
+
+def normalize_name(name: str) -> str:
+    """
+    NFKC + lowercase, drop spaces and punctuation, so "Osaka Castle" == "osakacastle"
+    """
+    name = unicodedata.normalize("NFKC", name or "").lower()
+    return re.sub(r"[\s\-_.,'’·・()（）「」]", "", name)
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371 * 2 * math.asin(math.sqrt(a))
+
+
+def to_coordinates(lat, lng):
+    """
+    Parse model output coordinates, :return (lat, lng) or None if missing / out of range
+    """
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (lat == 0 and lng == 0):
+        return None
+    return lat, lng
+
+
+class Gazetteer:
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.places = []
+        self.name_index = {}  # normalized name/alias -> [place]
+        self.grid = {}        # (cell_lat, cell_lng) -> [place]
+        self._load(path)
+
+    def _load(self, path: str):
+        if not os.path.exists(path):
+            print(f"❌ 找不到地名資料庫 {path}，離線地理編碼停用。")
+            return
+
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                name, aliases, kind, city, country, lat, lng = line.rstrip("\n").split("\t")
+                place = {
+                    "name": name,
+                    "kind": kind,
+                    "city": city,
+                    "country": country,
+                    "latitude": float(lat),
+                    "longitude": float(lng),
+                }
+                self.places.append(place)
+
+                for key in {normalize_name(n) for n in [name] + aliases.split("|") if n}:
+                    self.name_index.setdefault(key, []).append(place)
+                self.grid.setdefault(self._cell(place["latitude"], place["longitude"]), []).append(place)
+
+    @staticmethod
+    def _cell(lat, lng):
+        return int(math.floor(lat / GRID_CELL_DEG)), int(math.floor(lng / GRID_CELL_DEG))
+
+    def nearby(self, lat: float, lng: float, radius_km: float) -> list:
+        """
+        Places within radius_km, nearest first (only scans the surrounding grid cells)
+        """
+        span = int(math.ceil(radius_km / (GRID_CELL_DEG * 111))) + 1
+        c_lat, c_lng = self._cell(lat, lng)
+        found = []
+        for d_lat in range(-span, span + 1):
+            for d_lng in range(-span, span + 1):
+                for place in self.grid.get((c_lat + d_lat, c_lng + d_lng), []):
+                    dist = haversine_km(lat, lng, place["latitude"], place["longitude"])
+                    if dist <= radius_km:
+                        found.append((dist, place))
+        return [place for _, place in sorted(found, key=lambda x: x[0])]
+
+    def _candidates(self, name: str, min_ratio: float = MIN_MATCH_RATIO) -> list:
+        key = normalize_name(name)
+        if not key:
+            return []
+        if key in self.name_index:
+            return self.name_index[key]
+        if min_ratio >= 1:
+            return []
+
+        # Partial match, e.g. "大阪城天守閣 (大阪城)", only when the names mostly overlap
+        matches = []
+        for indexed, places in self.name_index.items():
+            if len(indexed) >= 2 and (indexed in key or key in indexed):
+                ratio = min(len(indexed), len(key)) / max(len(indexed), len(key))
+                if ratio >= min_ratio:
+                    matches.extend((ratio, p) for p in places)
+        matches.sort(key=lambda x: -x[0])
+        return [p for _, p in matches]
+
+    def lookup(self, name: str, near=None, kinds=None, min_ratio: float = MIN_MATCH_RATIO):
+        """
+        Resolve a place name.
+        :param near: (lat, lng); only places within MAX_DISTANCE_KM of it are returned, nearest first.
+                     Without it only an unambiguous exact name / alias match is returned.
+        :param kinds: restrict to these kinds (e.g. {"city"})
+        :param min_ratio: overlap needed for a partial name match (1 = exact only)
+        :return place dict or None
+        """
+        if near is None:
+            min_ratio = 1
+        candidates = [p for p in self._candidates(name, min_ratio) if not kinds or p["kind"] in kinds]
+        if not candidates:
+            return None
+        if near is None:
+            # Same name in several cities (e.g. 環球影城): no way to tell which one is meant
+            return candidates[0] if len({p["city"] for p in candidates}) == 1 else None
+
+        local = {id(p) for p in self.nearby(near[0], near[1], MAX_DISTANCE_KM)}
+        in_range = [p for p in candidates if id(p) in local]
+        if not in_range:
+            return None
+        return min(in_range, key=lambda p: haversine_km(near[0], near[1], p["latitude"], p["longitude"]))
+
+    def city_center(self, city: str):
+        """
+        :return (lat, lng) of the city, None if the gazetteer does not know it
+        """
+        place = None
+        for place in self._candidates(city, min_ratio=0):
+            if place["kind"] == "city":
+                break
+        else:
+            return None
+        return place["latitude"], place["longitude"]
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                _gazetteer = Gazetteer()
+    return _gazetteer
+
+
+def fill_missing_coordinates(trip_data: dict, destination: str = "") -> int:
+    """
+    Fill missing / implausible attraction coordinates in place after generation.
+    - missing, non-numeric or out of range coordinates
+    - coordinates far away from the destination city
+    - coordinates that disagree with a known gazetteer entry
+    Nothing is looked up when the destination is not in the gazetteer (its places would be
+    in other cities), the model coordinates are only sanity checked.
+    :return number of attractions fixed
+    """
+    gazetteer = get_gazetteer()
+    center = gazetteer.city_center(destination) if destination else None
+    fixed = 0
+
+    for day in trip_data.get("daily_itinerary", []) or []:
+        for spot in day.get("attractions", []) or []:
+            if not isinstance(spot, dict):
+                continue
+
+            coords = to_coordinates(spot.get("latitude"), spot.get("longitude"))
+            if coords and center and haversine_km(*coords, *center) > MAX_DISTANCE_KM:
+                coords = None
+
+            place = None
+            if center:
+                place = gazetteer.lookup(spot.get("name", ""), near=coords or center)
+                if place and haversine_km(place["latitude"], place["longitude"], *center) > MAX_DISTANCE_KM:
+                    place = None
+
+            if place and (coords is None or haversine_km(*coords, place["latitude"], place["longitude"]) > MAX_DRIFT_KM):
+                spot["latitude"], spot["longitude"] = place["latitude"], place["longitude"]
+                fixed += 1
+            elif coords:
+                spot["latitude"], spot["longitude"] = coords
+            else:
+                # Unknown place with unusable coordinates: drop them so the map skips it
+                spot["latitude"], spot["longitude"] = None, None
+
+    if fixed:
+        print(f"📍 [Geocode] 已用離線地名資料庫修正 {fixed} 個景點座標")
+    return fixed
@@ -0,0 +1,106 @@
+"""
+Background resolver for ticket card thumbnails.
+The ticket tool returns right away with the platform logo as a placeholder;
+the real image is searched here when the UI shows the card (off the LLM's
+critical path, so it never competes with the planner's searches), and cached.
+"""
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.tools.tool_cache import cached_tool, normalize_query
+from src.tools.singleflight import single_flight
+from src.tools.search_backend import get_search_backend, search_cache_enabled
+
+_SITE_URLS = {"klook": "klook.com", "kkday": "kkday.com"}
+MAX_RESOLVED_IMAGES = 500
+# A failed search (network / rate limit) shows the logo and is retried after this many seconds
+FAILED_RETRY_SECONDS = 5 * 60
+
+
+@single_flight("ticket_image")
+@cached_tool("ticket_image", region="wt-wt", ttl=7 * 24 * 3600, enabled=search_cache_enabled)
+def _search_ticket_image(keyword: str, site_url: str):
+    img_query = f"{keyword} scenery {site_url}"
+    img_results = get_search_backend().images(img_query, max_results=1)
+    return img_results[0].get('image') if img_results else None
+
+
+class ImageResolver:
+    def __init__(self, max_workers: int = 2):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ticket-image")
+        self._lock = threading.Lock()
+        self._resolved = OrderedDict()  # key -> image url (None = no image found)
+        self._pending = set()
+        self._failed = {}  # key -> monotonic time after which the lookup may be retried
+
+    @staticmethod
+    def _key(keyword: str, platform: str):
+        return normalize_query(keyword), normalize_query(platform or "klook")
+
+    def request(self, keyword: str, platform: str = "klook"):
+        """
+        Schedule a lookup (no-op if it is already resolved or in flight)
+        """
+        if not keyword:
+            return
+        key = self._key(keyword, platform)
+        with self._lock:
+            if key in self._resolved or key in self._pending or self._backing_off(key):
+                return
+            self._pending.add(key)
+        self._pool.submit(self._resolve, key, keyword, platform)
+
+    def _resolve(self, key, keyword: str, platform: str):
+        site_url = _SITE_URLS.get(key[1], "kkday.com")
+        try:
+            image = _search_ticket_image(keyword, site_url)
+        except Exception as e:
+            print(f"⚠️ [DDG Image Error] 圖片搜尋失敗 (使用 Logo): {e}")
+            # Not cached as "no image": the next request after the back-off searches again
+            with self._lock:
+                self._pending.discard(key)
+                self._failed[key] = time.monotonic() + FAILED_RETRY_SECONDS
+            return
+
+        with self._lock:
+            self._pending.discard(key)
+            self._failed.pop(key, None)
+            self._resolved[key] = image
+            while len(self._resolved) > MAX_RESOLVED_IMAGES:
+                self._resolved.popitem(last=False)
+
+    def get(self, keyword: str, platform: str = "klook"):
+        """
+        :return (done, image_url); image_url is None while pending, when nothing was found
+                 or when the last search failed (until FAILED_RETRY_SECONDS have passed)
+        """
+        key = self._key(keyword, platform)
+        with self._lock:
+            if key in self._resolved:
+                self._resolved.move_to_end(key)
+                return True, self._resolved[key]
+            if self._backing_off(key):
+                return True, None
+            return False, None
+
+    def _backing_off(self, key) -> bool:
+        # Caller holds the lock
+        retry_at = self._failed.get(key)
+        if retry_at is None:
+            return False
+        if time.monotonic() < retry_at:
+            return True
+        del self._failed[key]
+        return False
+
+
+_resolver = ImageResolver()
+
+
+def request_ticket_image(keyword: str, platform: str = "klook"):
+    _resolver.request(keyword, platform)
+
+
+def get_ticket_image(keyword: str, platform: str = "klook"):
+    return _resolver.get(keyword, platform)
@@ -0,0 +1,109 @@
+"""
+Process-wide token bucket rate limiter for DuckDuckGo searches.
+Shared by every tool and every Streamlit session, replaces the fixed random sleeps.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+from src.utils import telemetry
+
+DDG_RATE_PER_SEC = float(os.getenv("DDG_RATE_PER_SEC") or 1.0)
+DDG_BURST = int(os.getenv("DDG_BURST") or 3)
+
+
+class TokenBucket:
+    """
+    Token bucket with adaptive backoff.
+    - `rate` tokens are added per second, up to `burst` tokens.
+    - On a "Ratelimit" error the rate is halved and all requests pause for a cooldown.
+    - Every success restores the rate a little, back up to the configured value.
+    """
+
+    def __init__(self, rate: float = DDG_RATE_PER_SEC, burst: int = DDG_BURST,
+                 min_rate: float = 0.1, base_cooldown: float = 3.0, max_cooldown: float = 60.0):
+        self.base_rate = rate
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._cooldown = base_cooldown
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """
+        Block until a token is available.
+        :return seconds waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    wait = self._blocked_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_ratelimit(self):
+        """
+        Multiplicative decrease: halve the rate and pause everyone for a growing cooldown
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._blocked_until = max(self._blocked_until, now + self._cooldown)
+            print(f"⏳ [RateLimit] 觸發頻率限制，降速至 {self.rate:.2f} 次/秒，冷卻 {self._cooldown:.1f} 秒")
+            self._cooldown = min(self.max_cooldown, self._cooldown * 2)
+
+    def on_success(self):
+        """
+        Additive increase back to the configured rate
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.1)
+            self._cooldown = self.base_cooldown
+
+
+_limiter = TokenBucket()
+
+
+def get_rate_limiter() -> TokenBucket:
+    return _limiter
+
+
+@contextmanager
+def rate_limited():
+    """
+    Wrap one search request: wait for a token, then report success or a "Ratelimit" error
+    """
+    waited = _limiter.acquire()
+    if waited > 0.05:
+        print(f"🚦 [RateLimit] 等待 {waited:.1f}s")
+        telemetry.count("rate_limit_wait_ms", round(waited * 1000))
+    try:
+        yield
+    except Exception as e:
+        if "Ratelimit" in str(e):
+            _limiter.on_ratelimit()
+            telemetry.count("ratelimited")
+        raise
+    else:
+        _limiter.on_success()
@@ -0,0 +1,187 @@
+"""
+Pluggable search backends for the tools.
+- DuckDuckGoBackend: live search (pooled DDGS client + shared rate limiter)
+- RecordingBackend: proxies another backend and saves every result to disk
+- ReplayBackend: serves saved results from disk with configurable latency, no network
+
+Select with SEARCH_BACKEND=ddgs|record|replay (default ddgs).
+"""
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from src.tools.tool_cache import normalize_query
+from src.utils import telemetry
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND") or "ddgs"
+SEARCH_RECORD_DIR = os.getenv("SEARCH_RECORD_DIR") or ".cache/search_recordings"
+SEARCH_REPLAY_LATENCY = float(os.getenv("SEARCH_REPLAY_LATENCY") or 0)
+
+
+class SearchBackend(ABC):
+    """
+    Interface for all search backends.
+    """
+    # Whether results may be stored in the shared on-disk tool cache
+    cacheable = True
+
+    @abstractmethod
+    def text(self, query: str, region: str = "wt-wt", max_results: int = 5) -> list:
+        """
+        :return list of {"title", "href", "body"}
+        """
+        pass
+
+    @abstractmethod
+    def images(self, query: str, max_results: int = 1) -> list:
+        """
+        :return list of {"image", ...}
+        """
+        pass
+
+
+class DuckDuckGoBackend(SearchBackend):
+    def __init__(self):
+        # Imported here so the replay backend works without ddgs installed
+        from src.tools.ddgs_pool import ddgs_client
+        from src.tools.rate_limiter import rate_limited
+        self._client = ddgs_client
+        self._rate_limited = rate_limited
+
+    def text(self, query, region="wt-wt", max_results=5):
+        with telemetry.span("search.text", kind="search", **telemetry.user_input(query=query)) as span:
+            with self._rate_limited(), self._client() as ddgs:
+                results = list(ddgs.text(query, region=region, max_results=max_results))
+            span.set(results=len(results))
+            return results
+
+    def images(self, query, max_results=1):
+        with telemetry.span("search.images", kind="search", **telemetry.user_input(query=query)) as span:
+            with self._rate_limited(), self._client() as ddgs:
+                results = list(ddgs.images(query, max_results=max_results))
+            span.set(results=len(results))
+            return results
+
+
+def _recording_path(directory: str, kind: str, query: str, **params) -> str:
+    payload = json.dumps({"kind": kind, "query": normalize_query(query), **params}, ensure_ascii=False, sort_keys=True)
+    return os.path.join(directory, kind, hashlib.sha256(payload.encode("utf-8")).hexdigest() + ".json")
+
+
+class RecordingBackend(SearchBackend):
+    """
+    Forwards to `inner` and writes each successful result to `directory`
+    """
+    # Every query must reach the backend to be recorded
+    cacheable = False
+
+    def __init__(self, inner: SearchBackend, directory: str = SEARCH_RECORD_DIR):
+        self.inner = inner
+        self.directory = directory
+
+    def _save(self, path: str, kind: str, query: str, params: dict, results: list):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"kind": kind, "query": query, "params": params, "results": results}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def text(self, query, region="wt-wt", max_results=5):
+        results = self.inner.text(query, region=region, max_results=max_results)
+        params = {"region": region, "max_results": max_results}
+        self._save(_recording_path(self.directory, "text", query, **params), "text", query, params, results)
+        return results
+
+    def images(self, query, max_results=1):
+        results = self.inner.images(query, max_results=max_results)
+        params = {"max_results": max_results}
+        self._save(_recording_path(self.directory, "images", query, **params), "images", query, params, results)
+        return results
+
+
+class ReplayBackend(SearchBackend):
+    """
+    Serves recordings from `directory`.
+    :param latency: simulated seconds per request (uniform jitter of +-`jitter` ratio)
+    :param strict: raise LookupError for queries that were never recorded, otherwise return []
+    """
+    # Canned results (and [] for missing recordings) must never reach the production tool cache
+    cacheable = False
+
+    def __init__(self, directory: str = SEARCH_RECORD_DIR, latency: float = SEARCH_REPLAY_LATENCY,
+                 jitter: float = 0.0, strict: bool = False):
+        self.directory = directory
+        self.latency = latency
+        self.jitter = jitter
+        self.strict = strict
+        self.stats = {"served": 0, "missing": 0}
+        self._lock = threading.Lock()
+
+    def _load(self, path: str, query: str) -> list:
+        if self.latency > 0:
+            time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        try:
+            with open(path, encoding="utf-8") as f:
+                results = json.load(f)["results"]
+            with self._lock:
+                self.stats["served"] += 1
+            return results
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["missing"] += 1
+            if self.strict:
+                raise LookupError(f"No recording for '{query}'")
+            return []
+
+    def text(self, query, region="wt-wt", max_results=5):
+        with telemetry.span("search.text", kind="search", replay=True, **telemetry.user_input(query=query)) as span:
+            results = self._load(_recording_path(self.directory, "text", query, region=region, max_results=max_results), query)
+            span.set(results=len(results))
+            return results
+
+    def images(self, query, max_results=1):
+        with telemetry.span("search.images", kind="search", replay=True, **telemetry.user_input(query=query)) as span:
+            results = self._load(_recording_path(self.directory, "images", query, max_results=max_results), query)
+            span.set(results=len(results))
+            return results
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _create_backend(name: str) -> SearchBackend:
+    if name == "replay":
+        return ReplayBackend()
+    if name == "record":
+        return RecordingBackend(DuckDuckGoBackend())
+    return DuckDuckGoBackend()
+
+
+def get_search_backend() -> SearchBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _create_backend(SEARCH_BACKEND)
+                print(f"🔌 [Search] 使用搜尋後端: {type(_backend).__name__}")
+    return _backend
+
+
+def search_cache_enabled() -> bool:
+    """
+    Tool cache switch for the search tools: only live results are cached
+    """
+    return get_search_backend().cacheable
+
+
+def set_search_backend(backend: SearchBackend):
+    """
+    Swap the backend at runtime (benchmarks / load tests)
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
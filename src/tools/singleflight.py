@@ -0,0 +1,89 @@
+"""
+Single-flight request coalescing for search tools.
+Concurrent identical calls (from any Streamlit session) share one in-flight result.
+"""
+import threading
+import functools
+import inspect
+from src.tools.tool_cache import ToolCache
+from src.utils import telemetry
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._stats = {}
+
+    def do(self, tool: str, key: str, fn):
+        """
+        Run fn() once per key at a time; callers arriving while it runs wait for the same result
+        """
+        with self._lock:
+            counters = self._stats.setdefault(tool, {"calls": 0, "executed": 0, "merged": 0})
+            counters["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                counters["executed"] += 1
+            else:
+                counters["merged"] += 1
+
+        if not leader:
+            print(f"🔗 [SingleFlight] 合併相同的 {tool} 請求")
+            telemetry.count("singleflight_merged")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {tool: dict(c) for tool, c in self._stats.items()}
+
+
+_group = SingleFlight()
+
+
+def get_singleflight_stats() -> dict:
+    """
+    {tool: {"calls", "executed", "merged"}}, merged = calls that did not hit the network themselves
+    """
+    return _group.stats()
+
+
+def single_flight(tool: str):
+    """
+    Decorator: coalesce concurrent calls with the same normalized arguments
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = ToolCache.make_key(tool, fn.__name__, dict(bound.arguments))
+            return _group.do(tool, key, lambda: fn(*args, **kwargs))
+
+        return wrapper
+    return decorator
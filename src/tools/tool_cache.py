@@ -0,0 +1,178 @@
+"""
+Persistent on-disk cache (SQLite) for search tool results.
+Shared by every Streamlit session in the process, and survives restarts.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import functools
+import inspect
+import unicodedata
+from src.utils import telemetry
+
+CACHE_PATH = os.getenv("TOOL_CACHE_PATH") or ".cache/tool_cache.sqlite3"
+CACHE_MAX_ENTRIES = int(os.getenv("TOOL_CACHE_MAX_ENTRIES") or 5000)
+
+# TTL (seconds) for each tool, prices change faster than attraction info
+TOOL_TTLS = {
+    "search_internet": 12 * 3600,
+    "search_internet_average_cost": 7 * 24 * 3600,
+    "search_flight_average_cost": 24 * 3600,
+    "search_activity_tickets": 3 * 24 * 3600,
+}
+DEFAULT_TTL = 6 * 3600
+
+
+def normalize_query(value):
+    """
+    Normalize a query so that "Osaka  城", "osaka 城" and full-width variants share one key
+    """
+    if not isinstance(value, str):
+        return value
+    value = unicodedata.normalize("NFKC", value)
+    return " ".join(value.lower().split())
+
+
+class ToolCache:
+    """
+    SQLite backed TTL cache with size-bounded LRU eviction and hit/miss counters.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._stats = {}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(tool: str, region: str, args: dict) -> str:
+        payload = json.dumps(
+            {"tool": tool, "region": region, "args": {k: normalize_query(v) for k, v in args.items()}},
+            ensure_ascii=False, sort_keys=True, default=str
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _count(self, tool: str, field: str):
+        counters = self._stats.setdefault(tool, {"hits": 0, "misses": 0})
+        counters[field] += 1
+
+    def get(self, tool: str, key: str):
+        """
+        :return (hit, value)
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._count(tool, "misses")
+                return False, None
+
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self._count(tool, "hits")
+        return True, json.loads(row[0])
+
+    def set(self, tool: str, key: str, value, ttl: float):
+        now = time.time()
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, tool, value, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, tool, data, now + ttl, now)
+            )
+            # LRU eviction: drop expired rows first, then the least recently used ones
+            self._conn.execute("DELETE FROM entries WHERE expires_at < ?", (now,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            return {"entries": size, "tools": {tool: dict(c) for tool, c in self._stats.items()}}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self._stats.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tool_cache() -> ToolCache:
+    """
+    Process-wide cache instance (lazy, so importing tools never touches the disk)
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ToolCache()
+    return _cache
+
+
+def cached_tool(tool: str, region: str = "", ttl: float = None, enabled=None):
+    """
+    Decorator: cache the return value of a search function on its normalized arguments.
+    Exceptions are never cached, so a failed search is retried next time.
+    :param enabled: callable checked on every call; when it returns False the cache is bypassed
+    """
+    def decorator(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if enabled is not None and not enabled():
+                return fn(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+
+            cache = get_tool_cache()
+            key = ToolCache.make_key(tool, region, dict(bound.arguments))
+            hit, value = cache.get(tool, key)
+            if hit:
+                print(f"⚡ [Cache] 命中 {tool}: {dict(bound.arguments)}")
+                telemetry.count("cache_hits")
+                return value
+            telemetry.count("cache_misses")
+
+            value = fn(*args, **kwargs)
+            cache.set(tool, key, value, ttl if ttl is not None else TOOL_TTLS.get(tool, DEFAULT_TTL))
+            return value
+
+        return wrapper
+    return decorator
@@ -1,21 +1,28 @@
-from ddgs import DDGS
-import urllib.parse
-import time
-import random
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from src.tools.tool_cache import cached_tool, normalize_query
+from src.tools.singleflight import single_flight
+from src.tools.search_backend import get_search_backend, search_cache_enabled
+from src.tools.geocoder import get_gazetteer
+from src.utils import telemetry, progress
+
+TICKET_BATCH_WORKERS = 4
+
+@single_flight("search_internet")
+@cached_tool("search_internet", region="tw-tzh", enabled=search_cache_enabled)
+def _search_internet_results(query: str):
+    # top 5 results
+    return get_search_backend().text(query, region="tw-tzh", max_results=5)
 
 def search_internet(query: str):
     """
     使用 DuckDuckGo 搜尋網際網路上的最新資訊。
     當你不知道某個景點的細節、天氣、或是需要最新資訊時使用。
     """
-    # Random delay from being banned
-    time.sleep(random.uniform(1, 2))
     print(f"🌐 [Tool] 通用搜尋: {query}")
     
     try:
-        # top 5 results
-        results = list(DDGS().text(query, region="tw-tzh", max_results=5))
+        results = _search_internet_results(query)
         
         if not results:
             return "抱歉，網路上查無相關資訊。"
@@ -34,6 +41,31 @@ def search_internet(query: str):
         print(f"❌ 搜尋失敗: {e}")
         return f"搜尋工具暫時無法使用: {str(e)}"
 
+def geocode_place(name: str, city: str = ""):
+    """
+    查詢景點的經緯度座標 (離線地名資料庫，不需連網，速度極快)。
+    找不到時才改用 search_internet 查詢。
+    Args:
+        name: 景點名稱 (如 大阪城 / Osaka Castle)
+        city: 所在城市，用來區分同名景點 (如 大阪)
+    """
+    print(f"📍 [Tool] 查詢座標: {name} ({city})")
+
+    gazetteer = get_gazetteer()
+    center = gazetteer.city_center(city) if city else None
+    if city and center is None:
+        return {"error": f"離線資料庫沒有 '{city}' 的資料，請改用 search_internet 查詢座標"}
+    place = gazetteer.lookup(name, near=center)
+    if not place:
+        return {"error": f"離線資料庫查無 '{name}'，請改用 search_internet 查詢座標"}
+
+    return {
+        "name": place["name"],
+        "city": place["city"],
+        "latitude": place["latitude"],
+        "longitude": place["longitude"]
+    }
+
 def search_flights(origin: str, destination: str, departure_date: str):
     """
     產生機票比價連結 (Skyscanner & Google Flights)，不呼叫 API，完全免費。
@@ -71,73 +103,38 @@ def search_flights(origin: str, destination: str, departure_date: str):
     }
 
 # 2. 查詢 Klook/KKday 票券 
-def search_activity_tickets(keyword: str, platform: str = "klook"):
+@single_flight("search_activity_tickets")
+@cached_tool("search_activity_tickets", region="wt-wt", enabled=search_cache_enabled)
+def _lookup_ticket(keyword: str, site_url: str):
     """
-    搜尋票券，並嘗試抓取圖片與正確連結。
-    包含 Rate Limit 重試機制。
+    搜尋票券的文字結果 (會被快取)。圖片由 UI 顯示卡片時交給背景的 image_resolver 搜尋。
+    全部重試都失敗時直接丟出例外，讓外層使用 Fallback 且不寫入快取。
     """
-    # --- 隨機延遲，模擬人類操作 (避免 Ratelimit) ---
-    delay = random.uniform(2, 4)
-    time.sleep(delay) 
-    
-    print(f"🎫 [Tool] 搜尋票券: {keyword} ({platform}) - 延遲 {delay:.1f}s")
-
-    # 定義平台資訊
-    if platform == "klook":
-        site_url = "klook.com"
-        search_base = "https://www.klook.com/zh-TW/search?text="
-        logo_url = "https://cdn6.agoda.net/images/mv8/logo/klook_logo_multi_language.png"
-    else:
-        site_url = "kkday.com"
-        search_base = "https://www.kkday.com/zh-tw/product/productlist?keyword="
-        logo_url = "https://cdn.kkday.com/m-s/static/img/logo/kkday_logo_2.svg"
-
-    # 產生保底連結 (Fallback)
-    safe_keyword = urllib.parse.quote(keyword)
-    fallback_link = f"{search_base}{safe_keyword}"
-
-    # 預設回傳值
-    title = f"{keyword} - {platform.upper()} 優惠"
-    link = fallback_link
-    image = logo_url
-    price = "查看優惠"
+    found = {"title": None, "link": None}
 
     max_retries = 2
     for attempt in range(max_retries + 1):
         try:
-            # ⚠️ 修改重點：在初始化時不使用 Context Manager (with DDGS() as ddgs)，改用直接呼叫
-            # 這樣有時候能避開某些 Session 鎖死的問題
-            
-            ddgs = DDGS()
-            
+            # 預設的 DuckDuckGo 後端會從共用連線池借用 DDGS client (keep-alive)，
+            # Session 鎖死或斷線時連線池會丟棄該 client，重試時自動換新的
+
             # A. 搜尋文字
             query = f"site:{site_url} {keyword} 票"
             
             # 嘗試抓取結果
             # backend="api" 通常比預設的 "lite" 或 "html" 更穩定，但也更容易被擋
             # 如果這裡報錯，它會自動跳到 except 並觸發重試
-            text_results = list(ddgs.text(query, region="wt-wt", max_results=1))
+            text_results = get_search_backend().text(query, region="wt-wt", max_results=1)
             
             if text_results:
                 top = text_results[0]
-                title = top.get('title', title)
+                found["title"] = top.get('title')
                 # 確保連結長度足夠，避免抓到怪怪的短連結
                 if len(top.get('href', '')) > 15: 
-                    link = top.get('href')
-
-            # B. 搜尋圖片 (這是最容易報錯的地方，我們把它獨立包起來)
-            try:
-                time.sleep(random.uniform(1, 2)) # 稍微休息
-                img_query = f"{keyword} scenery {site_url}"
-                img_results = list(ddgs.images(img_query, max_results=1))
-                if img_results:
-                    image = img_results[0].get('image', logo_url)
-            except Exception as img_e:
-                print(f"⚠️ [DDG Image Error] 圖片搜尋失敗 (不影響主流程): {img_e}")
-                # 圖片失敗沒關係，我們繼續用 Logo
-
-            # 如果成功執行到這裡，就跳出重試迴圈
-            break 
+                    found["link"] = top.get('href')
+
+            # 如果成功執行到這裡，就回傳結果
+            return found
 
         except Exception as e:
             print(f"⚠️ [DDG Warning] 嘗試 {attempt+1}/{max_retries+1} 失敗: {e}")
@@ -145,25 +142,106 @@ def search_activity_tickets(keyword: str, platform: str = "klook"):
             # 如果是 SSL 協定錯誤 (0x304)，通常重試也沒用，直接跳出
             if "0x304" in str(e) or "Protocol" in str(e):
                 print("❌ [Fatal] SSL 協定不支援，停止重試，使用 Fallback 連結。")
-                break
+                raise
                 
+            # 冷卻時間由共用的 rate limiter 負責，下一次 acquire 會自動等待
             if "Ratelimit" in str(e) and attempt < max_retries:
-                wait_time = 3 * (attempt + 1)
-                print(f"⏳ 觸發頻率限制，冷卻 {wait_time} 秒後重試...")
-                time.sleep(wait_time)
+                print("⏳ 觸發頻率限制，冷卻後重試...")
+                telemetry.count("retries")
             else:
-                break
+                raise
+
+def search_activity_tickets(keyword: str, platform: str = "klook"):
+    """
+    搜尋票券，並嘗試抓取正確連結。
+    包含 Rate Limit 重試機制。
+    圖片先以平台 Logo 代替，真正的圖片在背景解析，不佔用 LLM 的等待時間。
+    """
+    print(f"🎫 [Tool] 搜尋票券: {keyword} ({platform})")
+
+    # 定義平台資訊
+    if platform == "klook":
+        site_url = "klook.com"
+        search_base = "https://www.klook.com/zh-TW/search?text="
+        logo_url = "https://cdn6.agoda.net/images/mv8/logo/klook_logo_multi_language.png"
+    else:
+        site_url = "kkday.com"
+        search_base = "https://www.kkday.com/zh-tw/product/productlist?keyword="
+        logo_url = "https://cdn.kkday.com/m-s/static/img/logo/kkday_logo_2.svg"
+
+    # 產生保底連結 (Fallback)
+    safe_keyword = urllib.parse.quote(keyword)
+    fallback_link = f"{search_base}{safe_keyword}"
+
+    # 預設回傳值
+    title = f"{keyword} - {platform.upper()} 優惠"
+    link = fallback_link
+    image = logo_url
+    price = "查看優惠"
+
+    try:
+        found = _lookup_ticket(keyword, site_url)
+        title = found.get("title") or title
+        link = found.get("link") or link
+    except Exception as e:
+        print(f"❌ 票券搜尋失敗，使用 Fallback 連結: {e}")
 
     return {
         "type": "ticket",
         "platform": platform,
+        "name": keyword,
         "title": title,
         "link": link,
         "image": image,
         "price": price
     }
 
+# 2-1. 一次查詢多個景點的票券
+def search_activity_tickets_batch(keywords: list[str], platforms: list[str] = None):
+    """
+    一次搜尋多個付費景點在多個平台 (Klook/KKday) 的票券。
+    會先移除重複的關鍵字，再於共用的 Rate Limit 下並行搜尋，所有票券卡片一次回傳。
+    Args:
+        keywords: 景點關鍵字列表 (如 ["USJ", "大阪城天守閣"])
+        platforms: 平台列表，預設 ["klook", "kkday"]
+    """
+    platforms = platforms or ["klook", "kkday"]
+
+    # 去除重複 (大小寫、全半形、多餘空白視為相同)
+    pairs = []
+    seen = set()
+    for keyword in keywords:
+        for platform in platforms:
+            key = (normalize_query(keyword), normalize_query(platform))
+            if keyword and key not in seen:
+                seen.add(key)
+                pairs.append((keyword.strip(), platform.lower().strip()))
+
+    print(f"🎫 [Tool] 批次搜尋票券: {len(pairs)} 組 (景點 {len(keywords)} x 平台 {len(platforms)})")
+
+    if not pairs:
+        return {"type": "ticket_batch", "tickets": []}
+
+    # 速率由共用的 rate limiter 控制，這裡只限制同時進行的數量
+    step = progress.counter("🎫 搜尋票券", len(pairs))
+
+    def search(keyword, platform):
+        ticket = search_activity_tickets(keyword, platform)
+        step(f"{keyword} ({platform})")
+        return ticket
+
+    with ThreadPoolExecutor(max_workers=min(TICKET_BATCH_WORKERS, len(pairs))) as pool:
+        futures = [telemetry.submit(pool, search, *pair) for pair in pairs]
+        tickets = [future.result() for future in futures]
+
+    return {"type": "ticket_batch", "tickets": tickets}
+
 # --- 工具 3: 搜尋網路上的平均旅遊花費 (爬蟲) ---
+@single_flight("search_internet_average_cost")
+@cached_tool("search_internet_average_cost", region="tw-tzh", enabled=search_cache_enabled)
+def _search_average_cost_results(query: str):
+    return get_search_backend().text(query, region="tw-tzh", max_results=3)
+
 def search_internet_average_cost(destination: str, days: int):
     """
     搜尋網路上 (PTT/Dcard/Blog) 關於該地點的平均旅遊花費。
@@ -179,7 +257,7 @@ def search_internet_average_cost(destination: str, days: int):
     query = f"{destination} {days}天 自由行 花費 ptt dcard 2024 2025"
     
     try:
-        results = list(DDGS().text(query, region="tw-tzh", max_results=3))
+        results = _search_average_cost_results(query)
         
         if not results:
             return "查無相關預算討論資料。"
@@ -195,6 +273,12 @@ def search_internet_average_cost(destination: str, days: int):
         print(f"❌ 預算搜尋失敗: {e}")
         return "預算搜尋工具暫時無法使用。"
 
+@single_flight("search_flight_average_cost")
+@cached_tool("search_flight_average_cost", region="tw-tzh", enabled=search_cache_enabled)
+def _search_flight_cost_results(query: str):
+    # 搜尋前 5 筆結果
+    return get_search_backend().text(query, region="tw-tzh", max_results=5)
+
 def search_flight_average_cost(origin: str, destination: str):
     """
     搜尋網路上關於該航線的平均機票價格行情 (爬蟲 PTT/Dcard/Blog)。
@@ -203,16 +287,12 @@ def search_flight_average_cost(origin: str, destination: str):
         origin: 出發地 (如 台北/TPE)
         destination: 目的地 (如 大阪/KIX)
     """
-    # 隨機延遲，模擬人類
-    time.sleep(random.uniform(2, 5))
-    
     # 關鍵字優化：加入年份確保資料夠新
     query = f"{origin} 到 {destination} 機票價格 ptt dcard 2024 2025 便宜"
     print(f"✈️ [Tool] 搜尋機票行情: {query}")
     
     try:
-        # 搜尋前 5 筆結果
-        results = list(DDGS().text(query, region="tw-tzh", max_results=5))
+        results = _search_flight_cost_results(query)
         
         if not results:
             return "查無相關機票價格討論。"
@@ -31,6 +31,24 @@ def get_tool_lists() -> list:
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "search_activity_tickets_batch",
+                    "description": "一次搜尋多個付費景點的門票 (建議把所有付費景點放在同一次呼叫)",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "keywords": {"type": "array", "items": {"type": "string"}},
+                            "platforms": {
+                                "type": "array",
+                                "items": {"type": "string", "enum": ["klook", "kkday"]}
+                            }
+                        },
+                        "required": ["keywords"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
@@ -46,6 +64,21 @@ def get_tool_lists() -> list:
                     }
                 }
             },
+            {
+                "type": "function",
+                "function": {
+                    "name": "geocode_place",
+                    "description": "查詢景點經緯度座標 (離線資料庫，優先使用，查無資料時再用 search_internet)",
+                    "parameters": {
+                        "type": "object",
+                        "properties": {
+                            "name": {"type": "string"},
+                            "city": {"type": "string"}
+                        },
+                        "required": ["name"]
+                    }
+                }
+            },
             {
                 "type": "function",
                 "function": {
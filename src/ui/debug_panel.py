@@ -0,0 +1,72 @@
+import streamlit as st
+import pandas as pd
+import altair as alt
+from src.utils.telemetry import get_tracer
+
+# Counters added with telemetry.count(), summed over the whole trace
+COUNTERS = ["cache_hits", "cache_misses", "singleflight_merged", "retries", "ratelimited",
+            "rate_limit_wait_ms", "tool_timeouts"]
+
+
+def _depths(spans: list) -> dict:
+    parents = {s["span_id"]: s["parent_id"] for s in spans}
+    depths = {}
+    for span_id in parents:
+        depth, parent = 0, parents[span_id]
+        while parent in parents:
+            depth, parent = depth + 1, parents[parent]
+        depths[span_id] = depth
+    return depths
+
+
+def render_trace_waterfall(trace_id):
+    """
+    渲染最近一次規劃的效能除錯面板 (span 瀑布圖 + 統計)
+    """
+    spans = get_tracer().get_trace(trace_id)
+    if not spans:
+        return
+
+    with st.expander("🐞 效能除錯 (Trace)", expanded=False):
+        origin = spans[0]["start"]
+        depths = _depths(spans)
+        rows = []
+        for idx, s in enumerate(spans):
+            attributes = s["attributes"]
+            label = s["name"]
+            if s["kind"] == "llm":
+                label += f" #{attributes.get('round', '')}"
+            rows.append({
+                "order": idx,
+                "span": f"{'  ' * depths[s['span_id']]}{label}",
+                "kind": s["kind"],
+                "start_ms": round((s["start"] - origin) * 1000, 1),
+                "end_ms": round((s["end"] - origin) * 1000, 1),
+                "duration_ms": s["duration_ms"],
+                "tokens": attributes.get("tokens"),
+                "status": s["status"],
+            })
+        df = pd.DataFrame(rows)
+
+        # === Summary ===
+        llm_spans = [s for s in spans if s["kind"] == "llm"]
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("總耗時", f"{df['end_ms'].max() / 1000:.1f}s")
+        col2.metric("LLM 呼叫", len(llm_spans))
+        col3.metric("Tokens", sum(s["attributes"].get("tokens", 0) for s in llm_spans))
+        col4.metric("工具呼叫", sum(1 for s in spans if s["kind"] == "tool"))
+
+        counters = {key: sum(s["attributes"].get(key, 0) for s in spans) for key in COUNTERS}
+        st.caption(" · ".join(f"{key}: {value}" for key, value in counters.items() if value) or "沒有快取命中 / 重試紀錄")
+
+        # === Waterfall ===
+        chart = alt.Chart(df).mark_bar().encode(
+            x=alt.X("start_ms:Q", title="ms"),
+            x2="end_ms:Q",
+            y=alt.Y("span:N", sort=alt.SortField("order"), title=None),
+            color=alt.Color("kind:N"),
+            tooltip=["span", "kind", "duration_ms", "tokens", "status"],
+        ).properties(height=max(120, 22 * len(df)))
+        st.altair_chart(chart, use_container_width=True)
+
+        st.dataframe(df.drop(columns=["order"]), use_container_width=True, hide_index=True)
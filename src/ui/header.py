@@ -1,23 +1,55 @@
 import streamlit as st
-from src.export.pdf_generator import convert_json_to_pdf
+from src.export.pdf_generator import start_pdf_export, get_pdf_export, RUNNING, FAILED
 from src.export.markdown_utils import create_itinerary_markdown
+from src.utils.render_cache import get_render_cache, content_hash
+
+# Seconds between progress polls of a running PDF export
+PDF_POLL_SECONDS = 0.5
 
 def render_header(result):
     """
     渲染結果頁面的標題與下載按鈕
+    匯出檔依行程內容快取，按其他按鈕造成的 rerun 不會重新產生 Markdown / PDF
     """
+    cache = get_render_cache()
+    digest = content_hash(result)
     col_title, col_btn = st.columns([2, 1])
     with col_title:
         st.title(f"✈️ {result.get('trip_name', '專屬旅程')}")
     
     with col_btn:
-        md_text = create_itinerary_markdown(result)
+        md_text = cache.get_or_render("markdown", result, create_itinerary_markdown, digest=digest)
         b1, b2 = st.columns(2)
         with b1:
             st.download_button("📝 Markdown", md_text, "plan.md", "text/markdown")
         with b2:
-            try:
-                pdf_bytes = convert_json_to_pdf(result)
-                st.download_button("📄 PDF", pdf_bytes, "plan.pdf", "application/pdf")
-            except:
-                st.warning("PDF 失敗")
\ No newline at end of file
+            render_pdf_export(result, digest)
+
+def render_pdf_export(result, digest):
+    """
+    PDF 只在按下按鈕後於背景產生 (結果頁不用等排版)，完成後換成下載按鈕
+    """
+    hit, pdf_bytes = get_render_cache().get("pdf", digest)
+    if hit:
+        st.download_button("📄 PDF", pdf_bytes, "plan.pdf", "application/pdf")
+        return
+
+    job = get_pdf_export(digest)
+    if job is None or job.status != RUNNING:
+        if job is not None and job.status == FAILED:
+            st.caption("⚠️ PDF 失敗")
+        if not st.button("📄 PDF", help="產生 PDF 檔", key=f"pdf_{digest[:12]}"):
+            return
+        start_pdf_export(result, digest)
+    render_pdf_progress(digest)
+
+@st.fragment(run_every=PDF_POLL_SECONDS)
+def render_pdf_progress(digest):
+    """
+    顯示背景 PDF 的進度 (只重跑這個 fragment)，結束時整頁 rerun 換成下載按鈕
+    """
+    job = get_pdf_export(digest)
+    if job is None or job.status != RUNNING:
+        st.rerun()
+        return
+    st.caption(job.progress)
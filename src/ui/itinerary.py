@@ -1,5 +1,58 @@
 import streamlit as st
 from src.templates import render_ticket_card
+from src.tools.image_resolver import request_ticket_image, get_ticket_image
+
+def _platform_style(act):
+    """
+    :return (platform, badge_color, platform_name, logo)
+    """
+    if 'klook' in act.get('platform', 'other').lower():
+        return "klook", "#FF5722", "KLOOK", "https://cdn6.agoda.net/images/mv8/logo/klook_logo_multi_language.png"
+    return "kkday", "#26A69A", "KKday", "https://cdn.kkday.com/m-s/static/img/logo/kkday_logo_2.svg"
+
+def _ticket_image(act, platform, logo):
+    """
+    票券縮圖：背景解析完成前先用平台 Logo
+    :return (img_url, pending)
+    """
+    img = act.get('image')
+    if img and img != logo:
+        return img, False
+
+    keyword = act.get('name') or act.get('title')
+    if not keyword:
+        return logo, False
+
+    done, resolved = get_ticket_image(keyword, platform)
+    if not done:
+        request_ticket_image(keyword, platform)
+        return logo, True
+    return resolved or logo, False
+
+def _render_ticket_cards(activities):
+    """
+    :return True 代表還有圖片在背景解析中
+    """
+    pending = False
+    for act in activities:
+        platform, badge, p_name, logo = _platform_style(act)
+        img, waiting = _ticket_image(act, platform, logo)
+        pending = pending or waiting
+        title = act.get('title') or act.get('name') or '優惠票券'
+        link = act.get('link') or act.get('ticket_link') or '#'
+        price = act.get('price', '查看優惠')
+
+        card_html = render_ticket_card(link, img, title, badge, p_name, price)
+        st.markdown(card_html, unsafe_allow_html=True)
+    return pending
+
+@st.fragment(run_every=2)
+def _render_pending_ticket_cards(activities):
+    """
+    圖片還沒到齊時，每 2 秒只重畫票券區；全部到齊後整頁重跑一次以停止輪詢
+    """
+    if not _render_ticket_cards(activities):
+        st.rerun()
 
 def render_itinerary(result):
     """
@@ -9,20 +62,15 @@ def render_itinerary(result):
     activities = result.get("activities", [])
     if activities:
         with st.expander("🎫 票券比價 (AI 估價)", expanded=True):
+            has_pending = False
             for act in activities:
-                platform = act.get('platform', 'other').lower()
-                if 'klook' in platform:
-                    badge = "#FF5722"; p_name = "KLOOK"; logo = "https://cdn6.agoda.net/images/mv8/logo/klook_logo_multi_language.png"
-                else:
-                    badge = "#26A69A"; p_name = "KKday"; logo = "https://cdn.kkday.com/m-s/static/img/logo/kkday_logo_2.svg"
-
-                img = act.get('image') or logo
-                title = act.get('title') or act.get('name') or '優惠票券'
-                link = act.get('link') or act.get('ticket_link') or '#'
-                price = act.get('price', '查看優惠')
-
-                card_html = render_ticket_card(link, img, title, badge, p_name, price)
-                st.markdown(card_html, unsafe_allow_html=True)
+                platform, _, _, logo = _platform_style(act)
+                has_pending = _ticket_image(act, platform, logo)[1] or has_pending
+
+            if has_pending:
+                _render_pending_ticket_cards(activities)
+            else:
+                _render_ticket_cards(activities)
 
     # === 每日行程區 ===
     daily_itinerary = result.get("daily_itinerary", [])
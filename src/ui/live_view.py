@@ -0,0 +1,58 @@
+import copy
+import streamlit as st
+from src.tools.geocoder import fill_missing_coordinates
+from src.ui.itinerary import render_itinerary
+from src.ui.map_view import render_map_view
+from src.llm_services.plan_jobs import get_job_runner
+
+# Seconds between progress polls of a running plan job
+POLL_SECONDS = 1.0
+
+def render_partial_plan(days, destination):
+    # job.days are shared by every session watching the job and end up in the final trip:
+    # fill the coordinates on a copy
+    partial = {"daily_itinerary": sorted(copy.deepcopy(days), key=lambda d: d.get("day") or 0)}
+    fill_missing_coordinates(partial, destination)
+
+    col_left, col_right = st.columns([1, 1.2])
+    with col_left:
+        render_itinerary(partial)
+    with col_right:
+        render_map_view(partial)
+
+@st.fragment(run_every=POLL_SECONDS)
+def render_plan_job(job_id, destination):
+    """
+    顯示背景規劃工作的進度與已完成的每日行程 (只重跑這個 fragment，不影響其他元件)。
+    工作結束時觸發整頁 rerun，讓 main 取用結果。
+    """
+    runner = get_job_runner()
+    job = runner.get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+        return
+    # Each poll tells the runner this session is still watching
+    session_id = st.session_state["session_id"]
+    runner.touch(job_id, session_id)
+
+    state = job.snapshot()
+    label = f"AI 正在規劃行程... {state['progress']} ({state['elapsed']:.0f}s)"
+    with st.status(label, expanded=True):
+        for line in state["log"][-8:]:
+            st.write(line)
+
+    if state["cancelling"]:
+        st.button("🛑 取消中...", disabled=True, key=f"cancel_{job_id}")
+    elif st.button("🛑 取消規劃", key=f"cancel_{job_id}"):
+        if not runner.cancel(job_id, session_id):
+            if job.finished:
+                # 按下取消前就已經完成，讓 main 取用結果
+                st.rerun()
+            # 其他使用者也在等同一份行程，工作繼續執行，只是這個 session 不再追蹤
+            st.session_state["job_id"] = None
+            st.toast("🛑 已取消規劃")
+            st.rerun()
+
+    # 已完成的天數 (串流或分天平行規劃時會陸續出現)
+    if state["days"]:
+        render_partial_plan(state["days"], destination)
@@ -1,6 +1,15 @@
 import streamlit as st
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 from src.map_utils import render_map
+from src.utils.render_cache import get_render_cache
+
+def render_map_html(trip_data):
+    """
+    地圖 HTML (依行程內容快取，內容沒變的 rerun 不會重建地圖)
+    """
+    return get_render_cache().get_or_render(
+        "map", trip_data, lambda trip: render_map(trip).get_root().render()
+    )
 
 def render_map_view(result):
     """
@@ -8,7 +17,6 @@ def render_map_view(result):
     """
     st.subheader("🗺️ 地圖")
     try:
-        map_obj = render_map(result)
-        st_folium(map_obj, height=700, width=None)
+        components.html(render_map_html(result), height=700)
     except:
-        st.error("地圖載入失敗")
\ No newline at end of file
+        st.error("地圖載入失敗")
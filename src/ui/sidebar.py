@@ -11,7 +11,7 @@ def render_sidebar():
         st.subheader("🤖 AI 模型")
         llm_provider = st.selectbox("選擇後端", 
             ["Google Gemini", "Groq (LPU)", "Hugging Face (Open Source)", 
-            "Local Ollama (Llama 3.1)","Remote Ollama (Cloudflare Tunnel)"])
+            "Local Ollama (Llama 3.1)","Remote Ollama (Cloudflare Tunnel)", "Hedged (自動備援)"])
         
         # API Key 檢查邏輯
         if llm_provider == "Google Gemini" and not (st.secrets['GOOGLE_API_KEY'] or os.getenv("GOOGLE_API_KEY")):
@@ -27,6 +27,8 @@ def render_sidebar():
                 st.error("❌ 缺少 REMOTE_OLLAMA 設定")
             else:
                 st.success("✅ 已設定遠端連線資訊")
+        elif llm_provider == "Hedged (自動備援)":
+            st.info("💡 先使用主要模型，超過其 p95 延遲或失敗時自動改用備援模型 (HEDGE_PRIMARY / HEDGE_SECONDARY)")
         
         st.divider()
 
@@ -49,6 +51,9 @@ def render_sidebar():
         
         st.divider()
         enable_flight_search = st.checkbox("啟用機票比價", value=True)
+        enable_streaming = st.checkbox("即時顯示規劃進度 (串流)", value=True)
+        use_plan_cache = st.checkbox("使用快取行程 (相同或相近條件)", value=True)
+        debug = st.checkbox("🐞 顯示效能除錯面板", value=False)
         submit_btn = st.button("🚀 開始規劃", type="primary")
 
         return {
@@ -60,5 +65,8 @@ def render_sidebar():
             "budget": budget_input,
             "interests": interests,
             "enable_flight_search": enable_flight_search,
+            "enable_streaming": enable_streaming,
+            "use_plan_cache": use_plan_cache,
+            "debug": debug,
             "submit": submit_btn
         }
\ No newline at end of file
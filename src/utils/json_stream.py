@@ -0,0 +1,98 @@
+"""
+Incremental parser for the trip JSON while it is still being streamed.
+Emits every `daily_itinerary` day as soon as its closing brace arrives.
+"""
+import json
+
+
+class IncrementalTripParser:
+    def __init__(self, array_key: str = "daily_itinerary"):
+        self.array_key = array_key
+        self.reset()
+
+    def reset(self):
+        """
+        Forget everything (e.g. the streamed text belonged to a tool calling round)
+        """
+        self.buffer = ""
+        self.days = []
+        self._pos = 0
+        self._started = False
+        self._stack = []          # open containers: "{" or "["
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._expect_key = False
+        self._last_key = None
+        self._array_depth = None  # stack depth of the daily_itinerary array
+        self._item_start = None   # buffer index of the day object being read
+
+    def feed(self, chunk: str) -> list:
+        """
+        :return days completed by this chunk
+        """
+        self.buffer += chunk
+        completed = []
+
+        while self._pos < len(self.buffer):
+            i = self._pos
+            ch = self.buffer[i]
+            self._pos += 1
+
+            if not self._started:
+                # Skip any preamble / ```json fence before the first brace
+                if ch != "{":
+                    continue
+                self._started = True
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._expect_key:
+                        self._last_key = self.buffer[self._string_start:i]
+                        self._expect_key = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif ch == "{":
+                if self._array_depth is not None and len(self._stack) == self._array_depth:
+                    self._item_start = i
+                self._stack.append("{")
+                self._expect_key = True
+            elif ch == "[":
+                # Only the top-level "daily_itinerary" key counts
+                if self._stack == ["{"] and self._last_key == self.array_key and self._array_depth is None:
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append("[")
+                self._expect_key = False
+            elif ch in "}]":
+                if self._stack:
+                    self._stack.pop()
+                if ch == "]" and self._array_depth is not None and len(self._stack) < self._array_depth:
+                    self._array_depth = -1  # array finished, never match again
+                if ch == "}" and self._item_start is not None and len(self._stack) == self._array_depth:
+                    day = self._parse_item(self.buffer[self._item_start:i + 1])
+                    self._item_start = None
+                    if day is not None:
+                        self.days.append(day)
+                        completed.append(day)
+            elif ch == ",":
+                self._expect_key = bool(self._stack) and self._stack[-1] == "{"
+            elif ch == ":":
+                self._expect_key = False
+
+        return completed
+
+    @staticmethod
+    def _parse_item(text: str):
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
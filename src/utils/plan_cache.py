@@ -0,0 +1,197 @@
+"""
+Plan-level cache in front of llm_service.generate_trip.
+Trip parameters are normalized into a key (interests sorted, ...), the parsed
+trip JSON is stored in SQLite with a TTL and LRU eviction. Optionally (off by
+default) a cached plan with a nearby budget / start date can be reused within a
+tolerance; its flight and budget analysis are dropped since they belong to the
+other budget / date.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import datetime
+import threading
+from src.tools.tool_cache import normalize_query
+
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH") or ".cache/plan_cache.sqlite3"
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL") or 24 * 3600)
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES") or 200)
+# Budgets are rounded to this step before building the exact key (1 = exact budget)
+PLAN_BUDGET_ROUNDING = int(os.getenv("PLAN_BUDGET_ROUNDING") or 1)
+# A cached plan is still accepted if its budget is within this ratio / its date within these days (0 = exact only)
+PLAN_BUDGET_TOLERANCE = float(os.getenv("PLAN_BUDGET_TOLERANCE") or 0)
+PLAN_DATE_TOLERANCE_DAYS = int(os.getenv("PLAN_DATE_TOLERANCE_DAYS") or 0)
+# Parts of a trip that depend on the exact budget / departure date, not served from a near match
+DATE_BUDGET_FIELDS = ("flight", "budget_analysis", "total_budget")
+
+
+def _to_ordinal(value) -> int:
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    if not isinstance(value, datetime.date):
+        value = datetime.date.fromisoformat(str(value)[:10])
+    return value.toordinal()
+
+
+def normalize_plan_params(inputs: dict) -> dict:
+    """
+    :param inputs: the dict returned by render_sidebar()
+    :return the parameters that decide the plan, in canonical form
+    """
+    interests = sorted({normalize_query(x) for x in inputs.get("interests") or [] if x and x.strip()})
+    budget = int(inputs["budget"])
+    return {
+        "provider": inputs.get("llm_provider") or "",
+        "destination": normalize_query(inputs["destination"]),
+        "origin": normalize_query(inputs.get("origin") or ""),
+        "days": int(inputs["days"]),
+        "interests": interests,
+        "flights": bool(inputs.get("enable_flight_search", True)),
+        "budget": int(round(budget / PLAN_BUDGET_ROUNDING) * PLAN_BUDGET_ROUNDING) if PLAN_BUDGET_ROUNDING > 0 else budget,
+        "start_day": _to_ordinal(inputs["start_date"]),
+    }
+
+
+def _hash(payload: dict) -> str:
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """
+    SQLite backed plan cache.
+    Exact key = every normalized parameter; group key = everything except budget and date,
+    which is what the tolerance lookup searches in.
+    """
+
+    def __init__(self, path: str = PLAN_CACHE_PATH, ttl: float = PLAN_CACHE_TTL, max_entries: int = PLAN_CACHE_MAX_ENTRIES,
+                 budget_tolerance: float = PLAN_BUDGET_TOLERANCE, date_tolerance_days: int = PLAN_DATE_TOLERANCE_DAYS):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.budget_tolerance = budget_tolerance
+        self.date_tolerance_days = date_tolerance_days
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        with self._lock:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS plans (
+                    key TEXT PRIMARY KEY,
+                    group_key TEXT NOT NULL,
+                    budget INTEGER NOT NULL,
+                    start_day INTEGER NOT NULL,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_group ON plans(group_key)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_plans_access ON plans(last_access)")
+            self._conn.commit()
+
+    @staticmethod
+    def make_keys(params: dict):
+        """
+        :param params: output of normalize_plan_params
+        :return (exact_key, group_key)
+        """
+        group = {k: v for k, v in params.items() if k not in ("budget", "start_day")}
+        return _hash(params), _hash(group)
+
+    def get(self, inputs: dict):
+        """
+        :return (match, trip): match is "exact", "near" or None (trip is None on a miss)
+        """
+        params = normalize_plan_params(inputs)
+        key, group_key = self.make_keys(params)
+        now = time.time()
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT key, value FROM plans WHERE key = ? AND expires_at >= ?", (key, now)
+            ).fetchone()
+            match = "exact" if row else None
+
+            if row is None and (self.budget_tolerance > 0 or self.date_tolerance_days > 0):
+                # Closest plan (relative budget gap + date gap) inside the tolerance window
+                budget_window = params["budget"] * self.budget_tolerance
+                row = self._conn.execute(
+                    """
+                    SELECT key, value FROM plans
+                    WHERE group_key = ? AND expires_at >= ?
+                      AND ABS(budget - ?) <= ? AND ABS(start_day - ?) <= ?
+                    ORDER BY ABS(budget - ?) * 1.0 / ? + ABS(start_day - ?) * 1.0 / ?
+                    LIMIT 1
+                    """,
+                    (group_key, now, params["budget"], budget_window, params["start_day"], self.date_tolerance_days,
+                     params["budget"], max(1.0, budget_window), params["start_day"], max(1, self.date_tolerance_days))
+                ).fetchone()
+                match = "near" if row else None
+
+            if row is None:
+                self._stats["misses"] += 1
+                return None, None
+
+            self._conn.execute("UPDATE plans SET last_access = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+            self._stats["hits" if match == "exact" else "near_hits"] += 1
+
+        print(f"⚡ [Plan Cache] 命中 ({match}) {params['destination']} {params['days']} 天 / TWD {params['budget']}")
+        trip = json.loads(row[1])
+        if match == "near":
+            for field in DATE_BUDGET_FIELDS:
+                trip.pop(field, None)
+        return match, trip
+
+    def set(self, inputs: dict, trip: dict):
+        params = normalize_plan_params(inputs)
+        key, group_key = self.make_keys(params)
+        now = time.time()
+        data = json.dumps(trip, ensure_ascii=False)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO plans (key, group_key, budget, start_day, value, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, group_key, params["budget"], params["start_day"], data, now + self.ttl, now)
+            )
+            # LRU eviction: drop expired plans first, then the least recently used ones
+            self._conn.execute("DELETE FROM plans WHERE expires_at < ?", (now,))
+            overflow = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0] - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM plans WHERE key IN (SELECT key FROM plans ORDER BY last_access ASC LIMIT ?)",
+                    (overflow,)
+                )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM plans").fetchone()[0]
+            return {"entries": size, **self._stats}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM plans")
+            self._conn.commit()
+            self._stats = {"hits": 0, "near_hits": 0, "misses": 0}
+
+
+_plan_cache = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> PlanCache:
+    global _plan_cache
+    if _plan_cache is None:
+        with _plan_cache_lock:
+            if _plan_cache is None:
+                _plan_cache = PlanCache()
+    return _plan_cache
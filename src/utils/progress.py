@@ -0,0 +1,44 @@
+"""
+Progress messages from deep inside a plan (tool batches, ticket searches) to whoever runs it.
+The listener lives in a context variable, so it follows the plan into worker threads
+submitted with telemetry.submit / telemetry.bind. Without a listener, report() is a no-op.
+"""
+import threading
+import contextvars
+from contextlib import contextmanager
+
+_listener = contextvars.ContextVar("progress_listener", default=None)
+
+
+@contextmanager
+def listen(callback):
+    """
+    :param callback: called with each progress message (from any thread)
+    """
+    token = _listener.set(callback)
+    try:
+        yield
+    finally:
+        _listener.reset(token)
+
+
+def report(message: str):
+    callback = _listener.get()
+    if callback is not None:
+        callback(message)
+
+
+def counter(label: str, total: int):
+    """
+    :return a function reporting "label n/total" with n counting up on each call (thread-safe)
+    """
+    lock = threading.Lock()
+    done = 0
+
+    def step(detail: str = ""):
+        nonlocal done
+        with lock:
+            done += 1
+            n = done
+        report(f"{label} {n}/{total}" + (f"：{detail}" if detail else ""))
+    return step
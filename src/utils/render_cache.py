@@ -0,0 +1,103 @@
+"""
+In-memory cache for outputs derived from a trip (Markdown, PDF bytes, map HTML).
+Keyed by a content hash of the trip JSON, so any rerun that does not change the trip
+reuses the output instead of rebuilding it. LRU eviction under a byte and entry budget.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+RENDER_CACHE_MAX_MB = float(os.getenv("RENDER_CACHE_MAX_MB") or 64)
+RENDER_CACHE_MAX_ENTRIES = int(os.getenv("RENDER_CACHE_MAX_ENTRIES") or 128)
+
+
+def content_hash(trip: dict) -> str:
+    """
+    Stable hash of the trip content (key order does not matter)
+    """
+    payload = json.dumps(trip, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _size(value) -> int:
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    return len(repr(value))
+
+
+class RenderCache:
+    def __init__(self, max_bytes: int = int(RENDER_CACHE_MAX_MB * 1024 * 1024),
+                 max_entries: int = RENDER_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (kind, hash) -> (value, size)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, kind: str, digest: str):
+        """
+        :return (hit, value)
+        """
+        with self._lock:
+            entry = self._entries.get((kind, digest))
+            if entry is None:
+                self._stats["misses"] += 1
+                return False, None
+            self._entries.move_to_end((kind, digest))
+            self._stats["hits"] += 1
+            return True, entry[0]
+
+    def set(self, kind: str, digest: str, value):
+        size = _size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop((kind, digest), None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[(kind, digest)] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self._stats["evictions"] += 1
+
+    def get_or_render(self, kind: str, trip: dict, render, digest: str = None):
+        """
+        :param render: trip -> output, only called on a miss; exceptions are not cached
+        :param digest: content_hash(trip) if the caller already has it
+        """
+        digest = digest or content_hash(trip)
+        hit, value = self.get(kind, digest)
+        if hit:
+            return value
+        value = render(trip)
+        self.set(kind, digest, value)
+        return value
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, **self._stats}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+_render_cache = None
+_render_cache_lock = threading.Lock()
+
+
+def get_render_cache() -> RenderCache:
+    global _render_cache
+    if _render_cache is None:
+        with _render_cache_lock:
+            if _render_cache is None:
+                _render_cache = RenderCache()
+    return _render_cache
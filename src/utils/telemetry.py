@@ -0,0 +1,307 @@
+"""
+Span-based tracing for planning requests.
+A plan is one trace (started with `trace()` in main.py); the agent loop, every LLM
+completion, every tool call and every search request add child spans carrying
+duration, tokens, retries and cache hits.
+
+Export (TELEMETRY_EXPORT):
+- "off" (default): keep spans in memory only (the debug panel still works)
+- "jsonl": one flat span per line in TELEMETRY_PATH
+- "otlp": one OTLP/JSON ExportTraceServiceRequest per line (what an OpenTelemetry
+  collector's file receiver reads)
+Lines are written by a background thread; the file is rotated to TELEMETRY_PATH.1
+once it grows past TELEMETRY_MAX_MB. User input (tool arguments, search queries,
+destination) is only recorded with TELEMETRY_CAPTURE_INPUTS=1.
+
+Spans only exist inside a trace, so background work (e.g. ticket thumbnails) is not traced.
+Thread pools do not inherit context variables: submit work with `copy_context().run`
+(see `submit` / `bind`) so its spans land under the caller's span.
+"""
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
+
+TELEMETRY_EXPORT = (os.getenv("TELEMETRY_EXPORT") or "off").lower()
+TELEMETRY_PATH = os.getenv("TELEMETRY_PATH") or ".cache/telemetry/spans.jsonl"
+TELEMETRY_MAX_MB = float(os.getenv("TELEMETRY_MAX_MB") or 50)
+TELEMETRY_CAPTURE_INPUTS = (os.getenv("TELEMETRY_CAPTURE_INPUTS") or "0").lower() in ("1", "true", "yes")
+# Traces kept in memory for the debug panel
+MAX_RECENT_TRACES = 20
+
+_current = contextvars.ContextVar("telemetry_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id, attributes: dict):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.start = time.time()
+        self.end = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def add(self, key: str, amount=1):
+        """
+        Increment a counter attribute (retries, cache hits, ...)
+        """
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.time()) - self.start) * 1000
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            attributes = dict(self.attributes)
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start": self.start,
+            "end": self.end,
+            "duration_ms": round(self.duration_ms, 1),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": attributes,
+        }
+
+
+class _NoopSpan:
+    """
+    Returned outside of a trace, so instrumented code never has to check
+    """
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, key, amount=1):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, str):
+        return {"stringValue": value}
+    return {"stringValue": json.dumps(value, ensure_ascii=False, default=str)}
+
+
+def to_otlp(span: dict) -> dict:
+    """
+    One finished span as an OTLP/JSON ExportTraceServiceRequest
+    """
+    attributes = {**span["attributes"], "span.kind": span["kind"]}
+    otlp_span = {
+        "traceId": span["trace_id"],
+        "spanId": span["span_id"],
+        "name": span["name"],
+        "kind": 1,  # SPAN_KIND_INTERNAL
+        "startTimeUnixNano": str(int(span["start"] * 1e9)),
+        "endTimeUnixNano": str(int(span["end"] * 1e9)),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items()],
+        "status": {"code": 2, "message": span["error"]} if span["error"] else {"code": 1},
+    }
+    if span["parent_id"]:
+        otlp_span["parentSpanId"] = span["parent_id"]
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": "travel-planner"}}]},
+            "scopeSpans": [{"scope": {"name": "src.utils.telemetry"}, "spans": [otlp_span]}],
+        }]
+    }
+
+
+class SpanWriter:
+    """
+    Appends span lines to a file on its own thread, so finishing a span never waits for disk.
+    Rotates the file (one backup, path + ".1") once it is larger than max_bytes.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        # Spans finished right before exit still reach the file
+        atexit.register(self.flush)
+
+    def write(self, line: dict):
+        self._queue.put(line)
+
+    def flush(self):
+        """
+        Wait until every queued line is on disk
+        """
+        self._queue.join()
+
+    def _loop(self):
+        while True:
+            lines = [self._queue.get()]
+            # Write whatever else is queued in the same open()
+            while True:
+                try:
+                    lines.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._append(lines)
+            except OSError as e:
+                print(f"⚠️ [Telemetry] 無法寫入 {self.path}: {e}")
+            finally:
+                for _ in lines:
+                    self._queue.task_done()
+
+    def _append(self, lines: list):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+            os.replace(self.path, self.path + ".1")
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines))
+
+
+class Tracer:
+    def __init__(self, export: str = TELEMETRY_EXPORT, path: str = TELEMETRY_PATH,
+                 max_bytes: int = int(TELEMETRY_MAX_MB * 1024 * 1024)):
+        self.export = export
+        self.path = path
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()  # trace_id -> list of finished span dicts
+        self._writer = SpanWriter(path, max_bytes) if export in ("jsonl", "otlp") else None
+
+    def finish(self, span: Span):
+        span.end = time.time()
+        data = span.to_dict()
+        with self._lock:
+            spans = self._traces.setdefault(span.trace_id, [])
+            spans.append(data)
+            self._traces.move_to_end(span.trace_id)
+            while len(self._traces) > MAX_RECENT_TRACES:
+                self._traces.popitem(last=False)
+
+        if self._writer is not None:
+            self._writer.write(to_otlp(data) if self.export == "otlp" else data)
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def get_trace(self, trace_id: str) -> list:
+        """
+        :return finished spans of a recent trace, ordered by start time
+        """
+        with self._lock:
+            return sorted(self._traces.get(trace_id, []), key=lambda s: s["start"])
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
+
+
+@contextmanager
+def _activate(span: Span):
+    token = _current.set(span)
+    try:
+        yield span
+    except GeneratorExit:
+        # An instrumented generator was closed early, not a failure
+        span.set(abandoned=True)
+        raise
+    except BaseException as e:
+        span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Generator finalized from another context (e.g. garbage collected)
+            pass
+        _tracer.finish(span)
+
+
+@contextmanager
+def trace(name: str, kind: str = "plan", **attributes):
+    """
+    Start a new trace (root span)
+    """
+    with _activate(Span(name, kind, uuid.uuid4().hex, None, attributes)) as span:
+        yield span
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attributes):
+    """
+    Child span of the current span; a no-op outside of a trace
+    """
+    parent = _current.get()
+    if parent is None:
+        yield _NOOP
+        return
+    with _activate(Span(name, kind, parent.trace_id, parent.span_id, attributes)) as child:
+        yield child
+
+
+def current_span():
+    return _current.get() or _NOOP
+
+
+def user_input(**attributes) -> dict:
+    """
+    Attributes holding user input (queries, tool arguments): empty unless TELEMETRY_CAPTURE_INPUTS is on.
+    Usage: telemetry.span("search.text", **telemetry.user_input(query=query))
+    """
+    return attributes if TELEMETRY_CAPTURE_INPUTS else {}
+
+
+def annotate(**attributes):
+    current_span().set(**attributes)
+
+
+def count(key: str, amount=1):
+    current_span().add(key, amount)
+
+
+def bind(fn):
+    """
+    fn bound to a copy of the current context. Each bound callable may run only once
+    at a time, so bind per submission.
+    """
+    return functools.partial(contextvars.copy_context().run, fn)
+
+
+def submit(pool, fn, *args, **kwargs):
+    """
+    pool.submit that carries the current span into the worker thread
+    """
+    return pool.submit(bind(fn), *args, **kwargs)